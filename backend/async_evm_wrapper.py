@@ -0,0 +1,532 @@
+"""Asyncio variant of the contract wrappers built on ``AsyncHTTPProvider``.
+
+web3 has no async contract objects, so calldata is encoded offline with the ABI and
+transactions are signed locally and sent with ``eth_sendRawTransaction``. All wrappers
+connected to the same node share one pooled ``aiohttp`` session and nonce manager per
+event loop, since both are bound to the loop they were first used in.
+
+Gas and fees come from the ``fee_strategy`` of the sync wrappers and receipts from their
+shared ``ReceiptWaiter``; both use a sync web3 instance and run off the event loop.
+"""
+import asyncio
+import itertools
+import time
+import weakref
+from concurrent.futures import Future
+from functools import partial
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import aiohttp
+import eth_account
+import web3
+from eth_utils import keccak
+from hexbytes import HexBytes
+from web3 import AsyncHTTPProvider
+from web3._utils.abi import map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3.eth import AsyncEth
+from web3.exceptions import ContractLogicError, TimeExhausted
+
+from backend.compiler import get_contract_interface
+from backend.evm_wrapper import STATES, AuctionSnapshot, BaseContractWrapper, BidderSnapshot, BlindAuction
+from backend.fees import FeeStrategy, calldata_shape, gas_stats, method_name
+from backend.metrics import async_rpc_metrics_middleware, register_abi, rpc_metrics, rpc_metrics_middleware, span
+from backend.pedersen import CURVE_ORDER, DEFAULT_PARAMETERS, PedersenEngine, get_engine
+from backend.providers import get_provider
+from backend.receipts import get_receipt_waiter
+from backend.signing import get_call_encoder, get_signing_key, sign_transaction
+from backend.transactions import is_known_transaction_error, is_nonce_error
+
+# event loop -> rpc_address -> session
+_sessions: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, aiohttp.ClientSession]]" = \
+    weakref.WeakKeyDictionary()
+
+
+async def get_session(rpc_address: str, max_connections: int = 100) -> aiohttp.ClientSession:
+    """Returns keep-alive session shared by all async wrappers of the node in the running loop."""
+    sessions = _sessions.setdefault(asyncio.get_running_loop(), {})
+    session = sessions.get(rpc_address)
+    if session is None or session.closed:
+        session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=max_connections))
+        sessions[rpc_address] = session
+    return session
+
+
+async def close_sessions():
+    """Closes the sessions of the running loop."""
+    sessions = _sessions.pop(asyncio.get_running_loop(), {})
+    for session in sessions.values():
+        await session.close()
+
+
+class AsyncNonceManager:
+    """Asyncio counterpart of ``NonceManager``."""
+
+    def __init__(self):
+        self._nonces: Dict[str, int] = {}
+        self._lock = asyncio.Lock()
+
+    async def next_nonce(self, web3_instance: web3.Web3, address: str) -> int:
+        async with self._lock:
+            nonce = self._nonces.get(address)
+            if nonce is None:
+                nonce = await web3_instance.eth.get_transaction_count(address, "pending")
+            self._nonces[address] = nonce + 1
+            return nonce
+
+    def resync(self, address: str):
+        self._nonces.pop(address, None)
+
+
+# event loop -> rpc_address -> nonce manager
+_nonce_managers: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, AsyncNonceManager]]" = \
+    weakref.WeakKeyDictionary()
+
+
+def get_nonce_manager(rpc_address: str) -> AsyncNonceManager:
+    """Returns nonce manager shared by all async wrappers of the node in the running loop."""
+    nonce_managers = _nonce_managers.setdefault(asyncio.get_running_loop(), {})
+    if rpc_address not in nonce_managers:
+        nonce_managers[rpc_address] = AsyncNonceManager()
+    return nonce_managers[rpc_address]
+
+
+class AsyncPendingTransaction:
+    """Handle of a sent transaction, ``await pending.wait()`` returns its receipt.
+
+    ``receipt_future`` comes from ``ReceiptWaiter.watch``, which fails it after the
+    wrapper's ``receipt_timeout``; ``timeout`` of ``wait`` only bounds this wait.
+    """
+
+    def __init__(self, web3_instance: web3.Web3, tx_hash, receipt_future: Future):
+        self.web3 = web3_instance
+        self.tx_hash = tx_hash
+        self.receipt_future = receipt_future
+        self.receipt = None
+
+    async def wait(self, timeout: Optional[float] = None):
+        if self.receipt is None:
+            try:
+                # shield: a timed out wait must not cancel the watch shared with other waiters
+                self.receipt = await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self.receipt_future)),
+                                                      timeout)
+            except asyncio.TimeoutError:
+                raise TimeExhausted(f"Transaction {HexBytes(self.tx_hash).hex()} is not in the chain "
+                                    f"after {timeout} seconds")
+        return self.receipt
+
+
+async def wait_all(pending: List[AsyncPendingTransaction], timeout: Optional[float] = None) -> list:
+    return await asyncio.gather(*(p.wait(timeout) for p in pending))
+
+
+class AsyncBaseContractWrapper:
+    receipt_timeout = BaseContractWrapper.receipt_timeout
+    # blocks that must be built on top of a receipt before it is returned
+    confirmations = 0
+    # the strategy of the sync wrappers, so gas estimates are shared with them
+    fee_strategy: FeeStrategy = BaseContractWrapper.fee_strategy
+
+    def __init__(self, rpc_address: str, contract_file: Path, contract_name: str, max_connections: int = 100):
+        self.web3 = web3.Web3(AsyncHTTPProvider(rpc_address), modules={"eth": (AsyncEth,)},
+                              middlewares=[async_rpc_metrics_middleware])
+        self.contract_name = contract_name
+        self.abi, self.bytecode = get_contract_interface(contract_file, contract_name)
+        register_abi(contract_name, self.abi)
+        self.contact_address = None
+        self.rpc_address = rpc_address
+        self.contract_file = contract_file
+        self.max_connections = max_connections
+        # sync instance of the fee strategy and receipt waiter, also builds the contract functions
+        self.sync_web3 = web3.Web3(get_provider(rpc_address))
+        self.sync_web3.middleware_onion.inject(rpc_metrics_middleware, "rpc_metrics", layer=0)
+        self.receipt_waiter = get_receipt_waiter(rpc_address, self.sync_web3)
+        self.encoder = get_call_encoder(contract_name, self.abi)
+        self._contract = self.sync_web3.eth.contract(abi=self.abi, bytecode=self.bytecode)
+        self._contracts = {}
+        self._chain_id = None
+        self._session = None
+
+    @property
+    def nonce_manager(self) -> AsyncNonceManager:
+        return get_nonce_manager(self.rpc_address)
+
+    async def connect(self):
+        """Attaches the shared pooled session, called lazily before the first request."""
+        session = await get_session(self.rpc_address, self.max_connections)
+        if session is not self._session:
+            await self.web3.provider.cache_async_session(session)
+            self._session = session
+
+    def get_contract_by_address(self, contract_address):
+        contract = self._contracts.get(contract_address)
+        if contract is None:
+            contract = self.sync_web3.eth.contract(address=contract_address, abi=self.abi)
+            self._contracts[contract_address] = contract
+        return contract
+
+    async def call(self, function_name: str, *args, address: Optional[str] = None, block_identifier="latest"):
+        await self.connect()
+        fn_abi = self._contract.get_function_by_name(function_name).abi
+        data = self._contract.encodeABI(fn_name=function_name, args=args)
+        raw = await self.web3.eth.call({"to": address or self.contact_address, "data": data}, block_identifier)
+        output_types = [output["type"] for output in fn_abi["outputs"]]
+        decoded = map_abi_data(BASE_RETURN_NORMALIZERS, output_types,
+                               self.sync_web3.codec.decode_abi(output_types, HexBytes(raw)))
+        return decoded[0] if len(decoded) == 1 else decoded
+
+    async def _transact(self, function, account: eth_account.account.LocalAccount,
+                        gas: Optional[int], gas_price: Optional[int], value: int = 0,
+                        wait: bool = True, nonce_retries: int = 2):
+        """Async counterpart of ``BaseContractWrapper._transact`` for a contract function or constructor.
+
+        ``gas``/``gas_price`` left as ``None`` are chosen by ``fee_strategy``. Returns receipt,
+        or ``AsyncPendingTransaction`` if ``wait`` is False.
+        """
+        method = f"{self.contract_name}.{method_name(function)}"
+        with span(f"transact {method}", account=account.address):
+            await self.connect()
+            transaction = await self._build_transaction(method, function, account, gas, gas_price, value)
+            key = get_signing_key(account)
+            for attempt in range(nonce_retries + 1):
+                with rpc_metrics.timed("stage", f"{method}:nonce"):
+                    transaction['nonce'] = await self.nonce_manager.next_nonce(self.web3, account.address)
+                with rpc_metrics.timed("stage", f"{method}:sign"):
+                    raw_transaction = sign_transaction(transaction, key)
+                try:
+                    with rpc_metrics.timed("stage", f"{method}:send"):
+                        tx_hash = await self.web3.eth.send_raw_transaction(raw_transaction)
+                    break
+                except BaseException as e:
+                    # the nonce may be unused (e.g. connection error), a local gap would stall the account
+                    self.nonce_manager.resync(account.address)
+                    if is_known_transaction_error(e):  # delivered by an attempt that seemed to fail
+                        tx_hash = HexBytes(keccak(raw_transaction))
+                        break
+                    if attempt == nonce_retries or not is_nonce_error(e):
+                        raise
+            pending = self._watch(method, calldata_shape(function), tx_hash)
+            return await pending.wait() if wait else pending
+
+    async def _build_transaction(self, method: str, function, account, gas, gas_price, value) -> dict:
+        """Unsigned transaction without nonce, the fee strategy runs in the default executor."""
+        if self._chain_id is None:
+            self._chain_id = await self.web3.eth.chain_id
+        transaction = {'from': account.address, 'chainId': self._chain_id, 'value': value}
+        to = getattr(function, "address", None)  # constructors have none
+        if to is not None:
+            transaction['to'] = to
+        with rpc_metrics.timed("stage", f"{method}:encode"):
+            transaction['data'] = self.encoder.encode_function(function)
+        loop = asyncio.get_running_loop()
+        with rpc_metrics.timed("stage", f"{method}:fees"):
+            transaction['gas'] = gas if gas is not None else await loop.run_in_executor(
+                None, self.fee_strategy.gas, self.sync_web3, method, function, transaction)
+            transaction.update({'gasPrice': gas_price} if gas_price is not None
+                               else await loop.run_in_executor(None, self.fee_strategy.fees, self.sync_web3))
+        return transaction
+
+    def _watch(self, method: str, shape: tuple, tx_hash) -> AsyncPendingTransaction:
+        sent_at = time.perf_counter()
+        receipt_future = self.receipt_waiter.watch(tx_hash, timeout=self.receipt_timeout,
+                                                   confirmations=self.confirmations)
+        receipt_future.add_done_callback(partial(self._record_gas, method, shape))
+        receipt_future.add_done_callback(lambda future: rpc_metrics.record(
+            "stage", f"{method}:receipt", time.perf_counter() - sent_at, error=future.exception() is not None))
+        return AsyncPendingTransaction(self.web3, tx_hash, receipt_future)
+
+    def _record_gas(self, method: str, shape: tuple, receipt_future):
+        if receipt_future.exception() is None:
+            gas_used = receipt_future.result()["gasUsed"]
+            gas_stats.record(method, gas_used)
+            self.fee_strategy.observe(method, shape, gas_used)
+
+    async def _transact_function(self, function_name: str, args: tuple, account, gas, gas_price,
+                                 value: int = 0, wait: bool = True):
+        function = self.get_contract_by_address(self.contact_address).functions[function_name](*args)
+        return await self._transact(function, account, gas, gas_price, value=value, wait=wait)
+
+
+class AsyncPedersen(AsyncBaseContractWrapper):
+    """Async ``Pedersen`` wrapper, supports the same ``mode`` values."""
+    modes = ("local", "on_chain", "cross_check")
+
+    def __init__(self, rpc_address: str, contract_file: Path, mode: str = "local", **kwargs):
+        super().__init__(rpc_address, contract_file, "Pedersen", **kwargs)
+        if mode not in self.modes:
+            raise ValueError(f"Unknown mode {mode}, expected one of {self.modes}")
+        self.mode = mode
+        self.parameters = None
+
+    async def deploy(self,
+                     deploy_account: eth_account.account.LocalAccount,
+                     gas=None,
+                     gas_price=None,
+                     q: int = DEFAULT_PARAMETERS["q"],
+                     gX: int = DEFAULT_PARAMETERS["gX"],
+                     gY: int = DEFAULT_PARAMETERS["gY"],
+                     hX: int = DEFAULT_PARAMETERS["hX"],
+                     hY: int = DEFAULT_PARAMETERS["hY"],
+                     ) -> str:
+        """Deploys contract to blockchain from specific account"""
+        contract_tx_info = await self._transact(self._contract.constructor(q, gX, gY, hX, hY),
+                                                deploy_account, gas, gas_price)
+        self.contact_address = contract_tx_info["contractAddress"]
+        self.parameters = {"q": q, "gX": gX, "gY": gY, "hX": hX, "hY": hY}
+        return self.contact_address
+
+    async def load_parameters(self) -> dict:
+        await self.connect()
+        values = await asyncio.gather(*(self.web3.eth.get_storage_at(self.contact_address, slot)
+                                        for slot in range(5)))
+        return {name: int.from_bytes(value, "big") for name, value in zip(("q", "gX", "gY", "hX", "hY"), values)}
+
+    async def get_engine(self) -> PedersenEngine:
+        if self.parameters is None:
+            self.parameters = await self.load_parameters() if self.contact_address else dict(DEFAULT_PARAMETERS)
+        return get_engine(**self.parameters)
+
+    async def _local_or_on_chain(self, function_name: str, compute, *args):
+        if self.mode == "on_chain":
+            return await self.call(function_name, *args)
+        result = compute(await self.get_engine())
+        if self.mode == "cross_check":
+            on_chain_result = await self.call(function_name, *args)
+            if isinstance(on_chain_result, (list, tuple)):
+                on_chain_result = tuple(on_chain_result)
+            if result != on_chain_result:
+                raise RuntimeError(f"{function_name}{args}: local result {result} "
+                                   f"differs from on-chain result {on_chain_result}")
+        return result
+
+    async def get_dot(self, b: int, r: int):
+        """Commitment ``b*G + r*H``, negative scalars are reduced modulo the curve order."""
+        b, r = b % CURVE_ORDER, r % CURVE_ORDER
+        return await self._local_or_on_chain("Commit", lambda engine: engine.commit(b, r), b, r)
+
+    async def commit_many(self, values: List[int], blindings: List[int], processes: int = 0):
+        """Batch version of ``get_dot``."""
+        values = [b % CURVE_ORDER for b in values]
+        blindings = [r % CURVE_ORDER for r in blindings]
+        if self.mode == "on_chain":
+            return [tuple(dot) for dot in await asyncio.gather(*(self.call("Commit", b, r)
+                                                                 for b, r in zip(values, blindings)))]
+        engine = await self.get_engine()
+        loop = asyncio.get_running_loop()
+        dots = await loop.run_in_executor(None, lambda: engine.commit_many(values, blindings, processes=processes))
+        if self.mode == "cross_check":
+            for dot, b, r in zip(dots, values, blindings):
+                await self._local_or_on_chain("Commit", lambda _: dot, b, r)
+        return dots
+
+    async def verify(self, b: int, r: int, cX: int, cY: int):
+        return await self._local_or_on_chain("Verify", lambda engine: engine.verify(b, r, cX, cY), b, r, cX, cY)
+
+    async def commitDelta(self, cX1: int, cY1: int, cX2: int, cY2: int):
+        return await self._local_or_on_chain("CommitDelta", lambda engine: engine.commit_delta(cX1, cY1, cX2, cY2),
+                                             cX1, cY1, cX2, cY2)
+
+    async def ecMul(self, b: int, cX1: int, cY1: int):
+        # ecMul is private in the contract, so it is always computed locally.
+        return (await self.get_engine()).ec_mul(b, cX1, cY1)
+
+    async def ecAdd(self, cX1: int, cY1: int, cX2: int, cY2: int):
+        return await self._local_or_on_chain("ecAdd", lambda engine: engine.ec_add(cX1, cY1, cX2, cY2),
+                                             cX1, cY1, cX2, cY2)
+
+
+class AsyncBlindAuction(AsyncBaseContractWrapper):
+    """Async ``BlindAuction`` wrapper, properties of the sync wrapper are coroutine methods here."""
+
+    def __init__(self, rpc_address: str, contract_file: Path, **kwargs):
+        super().__init__(rpc_address, contract_file, "BlindAuction", **kwargs)
+        self._pedersen: Optional[AsyncPedersen] = None
+        self._pedersen_of: Optional[str] = None  # auction address the cached wrapper belongs to
+
+    async def deploy(self,
+                     maxBid: int,
+                     bidBlockNumber: int,
+                     revealBlockNumber: int,
+                     winnerPaymentBlockNumber: int,
+                     maxBiddersCount: int,
+                     fairnessFees: int,
+                     pedersenAddress: str,
+                     k: int,
+                     testing: bool,
+                     eth_pay_value: int,
+                     deploy_account: eth_account.account.LocalAccount,
+                     gas=None,
+                     gas_price=None) -> str:
+        """Deploys contract to blockchain from specific account"""
+        constructor = self._contract.constructor(maxBid, bidBlockNumber, revealBlockNumber, winnerPaymentBlockNumber,
+                                                 maxBiddersCount, fairnessFees, pedersenAddress, k, testing)
+        contract_tx_info = await self._transact(constructor, deploy_account, gas, gas_price, value=eth_pay_value)
+        self.contact_address = contract_tx_info["contractAddress"]
+        return self.contact_address
+
+    async def snapshot(self, block_identifier: Optional[int] = None) -> AuctionSnapshot:
+        """Same as ``BlindAuction.snapshot``, the reads run concurrently over the pooled session."""
+        await self.connect()
+        if block_identifier is None:
+            block_identifier = await self.web3.eth.block_number
+        fields = BlindAuction.snapshot_fields
+        values = dict(zip(fields, await asyncio.gather(*(self.call(getter, block_identifier=block_identifier)
+                                                         for getter in fields.values()))))
+        values["state"] = STATES[values["state"]]
+
+        async def optional_call(*args):
+            try:
+                return await self.call(*args, block_identifier=block_identifier)
+            except (ContractLogicError, ValueError):
+                return None
+
+        bidders_count = await optional_call("biddersCount")
+        addresses = []
+        if bidders_count is not None:
+            addresses = [address for address in await asyncio.gather(*(optional_call("indexs", i)
+                                                                        for i in range(bidders_count)))
+                         if address is not None]
+        else:  # deployed without biddersCount, read indexs page by page
+            page_size = BlindAuction.index_page_size
+            while True:
+                page = await asyncio.gather(*(optional_call("indexs", i)
+                                              for i in range(len(addresses), len(addresses) + page_size)))
+                addresses.extend(itertools.takewhile(lambda address: address is not None, page))
+                if None in page:
+                    break
+        bidders = await asyncio.gather(*(self.call("bidders", address, block_identifier=block_identifier)
+                                         for address in addresses))
+        return AuctionSnapshot(address=self.contact_address, block_number=block_identifier,
+                               bidders=tuple(BidderSnapshot(address, *bidder)
+                                             for address, bidder in zip(addresses, bidders)),
+                               **values)
+
+    async def number_zkp(self):
+        return await self.call("number_zkp")
+
+    async def max_bid(self):
+        return await self.call("maxBid")
+
+    async def states(self):
+        return STATES[await self.call("states")]
+
+    async def auctioneer_address(self):
+        return await self.call("auctioneerAddress")
+
+    async def bid_block_number(self):
+        return await self.call("bidBlockNumber")
+
+    async def reveal_block_number(self):
+        return await self.call("revealBlockNumber")
+
+    async def winner_payment_block_number(self):
+        return await self.call("winnerPaymentBlockNumber")
+
+    async def max_bidders_count(self):
+        return await self.call("maxBiddersCount")
+
+    async def fairness_fees(self):
+        return await self.call("fairnessFees")
+
+    async def winner(self):
+        return await self.call("winner")
+
+    async def pedersen(self) -> AsyncPedersen:
+        """Wrapper of the auction's ``Pedersen``, kept while the auction address stays the same."""
+        if self._pedersen is None or self._pedersen_of != self.contact_address:
+            ped = AsyncPedersen(self.rpc_address, self.contract_file, max_connections=self.max_connections)
+            ped.contact_address = await self.call("getPedersenAddr")
+            self._pedersen, self._pedersen_of = ped, self.contact_address
+        return self._pedersen
+
+    async def is_withdraw_lock(self):
+        return await self.call("withdrawLock")
+
+    async def highest_bid(self):
+        return await self.call("highestBid")
+
+    async def bidders_count(self):
+        return await self.call("biddersCount")
+
+    async def bid(self, cX: int, cY: int, bid_amount_wei: int,
+                  account: eth_account.account.LocalAccount,
+                  gas=None,
+                  gas_price=None,
+                  wait: bool = True):
+        return await self._transact_function("Bid", (cX, cY), account, gas, gas_price,
+                                             value=bid_amount_wei, wait=wait)
+
+    async def reveal(self, cipher: bytes,
+                     account: eth_account.account.LocalAccount,
+                     gas=None,
+                     gas_price=None,
+                     wait: bool = True):
+        return await self._transact_function("Reveal", (cipher,), account, gas, gas_price, wait=wait)
+
+    async def zkp_commit(self, y: str,
+                         commits: List[int],
+                         account: eth_account.account.LocalAccount,
+                         gas=None,
+                         gas_price=None,
+                         wait: bool = True):
+        return await self._transact_function("ZKPCommit", (y, commits), account, gas, gas_price, wait=wait)
+
+    async def zkp_verify(self,
+                         response: List[int],
+                         account: eth_account.account.LocalAccount,
+                         gas=None,
+                         gas_price=None,
+                         wait: bool = True):
+        return await self._transact_function("ZKPVerify", (response,), account, gas, gas_price, wait=wait)
+
+    async def zkp_commit_verify(self, y: str,
+                                commits: List[int],
+                                response: List[int],
+                                account: eth_account.account.LocalAccount,
+                                gas=None,
+                                gas_price=None,
+                                wait: bool = True):
+        return await self._transact_function("ZKPCommitVerify", (y, commits, response), account, gas, gas_price,
+                                             wait=wait)
+
+    async def verify_all(self,
+                         account: eth_account.account.LocalAccount,
+                         gas=None,
+                         gas_price=None,
+                         wait: bool = True):
+        return await self._transact_function("VerifyAll", (), account, gas, gas_price, wait=wait)
+
+    async def claim_winner(self,
+                           winner: str,
+                           bid: int,
+                           r: int,
+                           account: eth_account.account.LocalAccount,
+                           gas=None,
+                           gas_price=None,
+                           wait: bool = True):
+        return await self._transact_function("ClaimWinner", (winner, bid, r), account, gas, gas_price, wait=wait)
+
+    async def withdraw(self, account: eth_account.account.LocalAccount,
+                       gas=None,
+                       gas_price=None,
+                       wait: bool = True):
+        return await self._transact_function("Withdraw", (), account, gas, gas_price, value=1, wait=wait)
+
+    async def winner_pay(self, account: eth_account.account.LocalAccount,
+                         gas=None,
+                         gas_price=None,
+                         wait: bool = True):
+        return await self._transact_function("WinnerPay", (), account, gas, gas_price, value=1, wait=wait)
+
+    async def destroy(self, account: eth_account.account.LocalAccount,
+                      gas=None,
+                      gas_price=None,
+                      wait: bool = True):
+        return await self._transact_function("Destroy", (), account, gas, gas_price, wait=wait)
+
+    async def challenge_by_auctioneer(self, account: eth_account.account.LocalAccount,
+                                      gas=None,
+                                      gas_price=None,
+                                      wait: bool = True):
+        return await self._transact_function("challengeByAuctioneer", (), account, gas, gas_price, wait=wait)
@@ -0,0 +1,86 @@
+"""Caches of contract reads shared by all wrappers of a process."""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional
+
+import web3
+
+from backend.receipts import ReceiptWaiter
+
+
+class LRUCache:
+    """Thread-safe mapping keeping at most ``maxsize`` most recently used entries."""
+
+    def __init__(self, maxsize: int = 4096):
+        self.maxsize = maxsize
+        self._data: "OrderedDict[Hashable, object]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable, default=None):
+        with self._lock:
+            if key not in self._data:
+                return default
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class BlockClock:
+    """Latest block number of a node without a request per read.
+
+    The head seen by the receipt waiter (which follows new blocks while transactions
+    are pending) and mined receipts move it forward. Otherwise ``eth_blockNumber`` is
+    requested at most once per ``min_interval`` seconds.
+    """
+
+    def __init__(self, web3_instance: web3.Web3, receipt_waiter: Optional[ReceiptWaiter] = None,
+                 min_interval: float = 1.0):
+        self.web3 = web3_instance
+        self.receipt_waiter = receipt_waiter
+        self.min_interval = min_interval
+        self._block: Optional[int] = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+
+    def current(self) -> int:
+        with self._lock:
+            head = self.receipt_waiter.head if self.receipt_waiter is not None else None
+            if head is not None and (self._block is None or head > self._block):
+                self._block = head
+            now = time.monotonic()
+            if self._block is None or now - self._checked > self.min_interval:
+                self._block = max(self._block or 0, self.web3.eth.block_number)
+                self._checked = now
+            return self._block
+
+    def observe(self, block_number: int):
+        with self._lock:
+            if self._block is None or block_number > self._block:
+                self._block = block_number
+
+
+_clocks: Dict[str, BlockClock] = {}
+_clocks_lock = threading.Lock()
+
+
+def get_block_clock(rpc_address: str, web3_instance: web3.Web3,
+                    receipt_waiter: Optional[ReceiptWaiter] = None) -> BlockClock:
+    """Returns block clock shared by all wrappers connected to the same node."""
+    with _clocks_lock:
+        if rpc_address not in _clocks:
+            _clocks[rpc_address] = BlockClock(web3_instance, receipt_waiter)
+        return _clocks[rpc_address]
@@ -0,0 +1,113 @@
+"""Solidity compilation with process-wide and on-disk artifact caches.
+
+Artifacts are keyed by the hash of the source, the solc version spec and the optimizer
+settings. ``solcx`` is only imported (and solc resolved and installed) on a cache miss,
+so importing the wrappers works offline once the artifacts are cached. ``SOLC_VERSION``
+is pinned by default; with ``latest`` the artifacts of the solc that was newest at the
+first compilation are reused until the cache is cleared.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import hashlib
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Optional, Union
+
+SOLC_VERSION = os.environ.get("SOLC_VERSION", "0.8.19")
+SOLC_LOOKUP_TIMEOUT = float(os.environ.get("SOLC_LOOKUP_TIMEOUT", "10"))  # seconds
+CACHE_DIR = Path(os.environ.get("CONTRACTS_CACHE_DIR", Path.home() / ".cache" / "closed_auction"))
+
+_artifacts = {}
+_lock = threading.Lock()
+
+
+def read_source(sol_file: Union[str, Path]) -> str:
+    if isinstance(sol_file, str):
+        with open(sol_file) as f:
+            return f.read()
+    elif isinstance(sol_file, Path):
+        return sol_file.read_text()
+    raise NotImplementedError("Unknown type of input sol filepath")
+
+
+@lru_cache(maxsize=None)
+def resolve_solc_version(solc_version: str) -> str:
+    """Returns the concrete version of ``solc_version``, ``latest`` is the newest installable one.
+
+    The list of installable versions is fetched with ``SOLC_LOOKUP_TIMEOUT``, when it
+    can not be fetched the newest installed solc is used.
+    """
+    if solc_version != "latest":
+        return solc_version.lstrip("v")
+    from solcx import get_installable_solc_versions, get_installed_solc_versions
+
+    executor = ThreadPoolExecutor(max_workers=1)
+    try:
+        return str(executor.submit(get_installable_solc_versions).result(timeout=SOLC_LOOKUP_TIMEOUT)[0])
+    except (OSError, FutureTimeoutError):  # offline: the newest solc already installed
+        installed = get_installed_solc_versions()
+        if not installed:
+            raise
+        return str(max(installed))
+    finally:
+        executor.shutdown(wait=False)
+
+
+def _cache_key(src: str, solc_version: str, optimize: bool, optimize_runs: Optional[int]) -> str:
+    settings = json.dumps([solc_version, optimize, optimize_runs])
+    return hashlib.sha256(f"{settings}\n{src}".encode()).hexdigest()
+
+
+def _compile(src: str, solc_version: str, optimize: bool, optimize_runs: Optional[int]) -> dict:
+    from solcx import compile_source, install_solc
+
+    version = install_solc(version=resolve_solc_version(solc_version))
+    kwargs = {"optimize_runs": optimize_runs} if optimize_runs is not None else {}
+    compiled_sol = compile_source(src, optimize=optimize, allow_paths=[Path("./")],
+                                  solc_version=version, **kwargs)
+    return {"solc_version": str(version),
+            "contracts": {name: {"abi": contract["abi"], "bin": contract["bin"]}
+                          for name, contract in compiled_sol.items()}}
+
+
+def _write_artifact(path: Path, artifact: dict):
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp_path.write_text(json.dumps(artifact))
+        os.replace(tmp_path, path)
+    except OSError:
+        pass  # read-only cache dir: keep the in-memory artifact only
+
+
+def get_artifacts(sol_file: Union[str, Path],
+                  solc_version: str = SOLC_VERSION,
+                  optimize: bool = True,
+                  optimize_runs: Optional[int] = None) -> dict:
+    """Returns ``{"solc_version": ..., "contracts": {"<stdin>:Name": {"abi", "bin"}}}`` for the source."""
+    src = read_source(sol_file)
+    key = _cache_key(src, solc_version, optimize, optimize_runs)
+    with _lock:
+        artifact = _artifacts.get(key)
+        if artifact is None:
+            path = CACHE_DIR / f"{key}.json"
+            try:
+                artifact = json.loads(path.read_text())
+            except (OSError, ValueError):
+                artifact = _compile(src, solc_version, optimize, optimize_runs)
+                _write_artifact(path, artifact)
+            _artifacts[key] = artifact
+    return artifact
+
+
+def abi_hash(abi: list) -> str:
+    """Hash of the ABI, tells apart versions of a contract compiled under the same name."""
+    return hashlib.sha256(json.dumps(abi, sort_keys=True).encode()).hexdigest()
+
+
+def get_contract_interface(sol_file: Union[str, Path], contract_name: str, **kwargs):
+    """Returns ``(abi, bytecode)`` of the contract from the cached artifacts."""
+    contract = get_artifacts(sol_file, **kwargs)["contracts"][f'<stdin>:{contract_name}']
+    return contract["abi"], contract["bin"]
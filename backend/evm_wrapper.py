@@ -1,101 +1,480 @@
-from typing import List
+import threading
+import time
+from dataclasses import dataclass
+from functools import partial
+from typing import Dict, List, Optional, Tuple
 
 import web3
 import eth_account
+from eth_utils import keccak
+from hexbytes import HexBytes
 from pathlib import Path
-from solcx import compile_source, install_solc
+from web3._utils.abi import map_abi_data
+from web3._utils.normalizers import BASE_RETURN_NORMALIZERS
+from web3.exceptions import BadFunctionCallOutput, ContractLogicError
+from web3.providers import BaseProvider
 
-install_solc(version="latest")
+from backend.cache import LRUCache, get_block_clock
+from backend.compiler import get_contract_interface
+from backend.fees import EstimatingFeeStrategy, FeeStrategy, calldata_shape, gas_stats, method_name
+from backend.metrics import register_abi, rpc_metrics, rpc_metrics_middleware, span
+from backend.providers import get_provider
+from backend.pedersen import CURVE_ORDER, DEFAULT_PARAMETERS, PedersenEngine, get_engine
+from backend.receipts import get_receipt_waiter
+from backend.rpc import batch_request
+from backend.signing import get_call_encoder, get_signing_key, sign_many, sign_transaction
+from backend.transactions import (BatchSendError, PendingTransaction, get_nonce_manager, is_known_transaction_error,
+                                  is_nonce_error, wait_all)
+from backend.zkp import InvalidProofError, check_proofs
+
+STATES = ["Init", "Challenge", "ChallengeDelta", "Verify", "VerifyDelta", "ValidWinner"]
+
+
+class StateUnavailableError(ValueError):
+    """Contract state could not be read at the requested block."""
 
 
 class BaseContractWrapper:
-    def __init__(self, rpc_address: str, contract_file: Path, contract_name: str):
-        self.web3 = web3.Web3(web3.HTTPProvider(rpc_address))
+    receipt_timeout = 600
+    # blocks that must be built on top of a receipt before it is returned
+    confirmations = 0
+    # shared by all wrappers, so gas estimates are cached process-wide
+    fee_strategy: FeeStrategy = EstimatingFeeStrategy()
+
+    def __init__(self, rpc_address: str, contract_file: Path, contract_name: str,
+                 provider: Optional[BaseProvider] = None):
+        """``rpc_address`` is one or more comma separated node URLs, wrappers of the same
+        address share one ``PooledProvider``. ``provider`` replaces it, e.g. an in-process
+        ``EthereumTesterProvider``; ``rpc_address`` still names the node for shared state."""
+        self.web3 = web3.Web3(provider or get_provider(rpc_address))
+        self.web3.middleware_onion.inject(rpc_metrics_middleware, "rpc_metrics", layer=0)
         self.contract_name = contract_name
         self.abi, self.bytecode = self.compile_contract(contract_file)
+        register_abi(contract_name, self.abi)
         self.contact_address = None
         self.rpc_address = rpc_address
         self.contract_file = contract_file
+        self._contracts = {}
+        self.nonce_manager = get_nonce_manager(rpc_address)
+        self.receipt_waiter = get_receipt_waiter(rpc_address, self.web3)
+        self.block_clock = get_block_clock(rpc_address, self.web3, self.receipt_waiter)
+        self._chain_id = None
+        self.encoder = get_call_encoder(contract_name, self.abi)
+        # (account, method, to) -> transaction fields that do not change between calls
+        self._templates = {}
 
     def compile_contract(self, sol_file: Path):
-        """Compiles solidity contract."""
-        if isinstance(sol_file, str):
-            with open(sol_file) as f:
-                src = f.read()
-        elif isinstance(sol_file, Path):
-            src = sol_file.read_text()
-        else:
-            raise NotImplemented("Unknown type of input sol filepath")
-        compiled_sol = compile_source(src, optimize=True, allow_paths=[Path("./")])
-        contract = compiled_sol[f'<stdin>:{self.contract_name}']
-        bytecode = contract['bin']
-        abi = contract['abi']
-        return abi, bytecode
+        """Compiles solidity contract, artifacts are cached by source hash and compiler settings."""
+        return get_contract_interface(sol_file, self.contract_name)
 
     def get_contract_by_address(self, contract_address):
-        contract = self.web3.eth.contract(address=contract_address,
-                                          abi=self.abi)
+        contract = self._contracts.get(contract_address)
+        if contract is None:
+            contract = self.web3.eth.contract(address=contract_address,
+                                              abi=self.abi)
+            self._contracts[contract_address] = contract
         return contract
 
+    def _transact(self, function, account: eth_account.account.LocalAccount,
+                  gas: Optional[int], gas_price: Optional[int], value: int = 0, wait: bool = True,
+                  nonce_retries: int = 2):
+        """Signs and sends contract function call or constructor.
+
+        Nonce comes from the shared ``NonceManager``, it is resynced with the node whenever
+        sending fails, so a lost transaction leaves no gap. ``gas``/``gas_price`` left as ``None`` are chosen by
+        ``fee_strategy``. Returns receipt, or ``PendingTransaction`` if ``wait`` is False.
+        """
+        method = f"{self.contract_name}.{method_name(function)}"
+        with span(f"transact {method}", account=account.address):
+            return self._send_transaction(method, function, account, gas, gas_price, value, wait, nonce_retries)
+
+    def _send_transaction(self, method: str, function, account, gas, gas_price, value, wait, nonce_retries):
+        transaction = self._build_transaction(method, function, account, gas, gas_price, value)
+        key = get_signing_key(account)
+        for attempt in range(nonce_retries + 1):
+            with rpc_metrics.timed("stage", f"{method}:nonce"):
+                transaction['nonce'] = self.nonce_manager.next_nonce(self.web3, account.address)
+            with rpc_metrics.timed("stage", f"{method}:sign"):
+                raw_transaction = sign_transaction(transaction, key)
+            try:
+                with rpc_metrics.timed("stage", f"{method}:send"):
+                    tx_hash = self.web3.eth.sendRawTransaction(raw_transaction)
+                break
+            except BaseException as e:
+                # the nonce may be unused (e.g. connection error), a local gap would stall the account
+                self.nonce_manager.resync(account.address)
+                if is_known_transaction_error(e):  # delivered by an attempt that seemed to fail
+                    tx_hash = HexBytes(keccak(raw_transaction))
+                    break
+                if attempt == nonce_retries or not is_nonce_error(e):
+                    raise
+        pending = self._watch(method, calldata_shape(function), tx_hash)
+        return pending.wait() if wait else pending
+
+    def _build_transaction(self, method: str, function, account, gas, gas_price, value) -> dict:
+        """Unsigned transaction without nonce, built from the ``(account, method, to)`` template."""
+        if self._chain_id is None:
+            self._chain_id = self.web3.eth.chain_id
+        to = getattr(function, "address", None)  # constructors have none
+        template = self._templates.get((account.address, method, to))
+        if template is None:
+            template = {'from': account.address, 'chainId': self._chain_id}
+            if to is not None:
+                template['to'] = to
+            self._templates[account.address, method, to] = template
+        with rpc_metrics.timed("stage", f"{method}:encode"):
+            transaction = dict(template, value=value, data=self.encoder.encode_function(function))
+        with rpc_metrics.timed("stage", f"{method}:fees"):
+            transaction['gas'] = gas if gas is not None else self.fee_strategy.gas(self.web3, method, function,
+                                                                                    transaction)
+            transaction.update({'gasPrice': gas_price} if gas_price is not None
+                               else self.fee_strategy.fees(self.web3))
+        return transaction
+
+    def _watch(self, method: str, shape: tuple, tx_hash) -> PendingTransaction:
+        sent_at = time.perf_counter()
+        receipt_future = self.receipt_waiter.watch(tx_hash, timeout=self.receipt_timeout,
+                                                   confirmations=self.confirmations)
+        receipt_future.add_done_callback(partial(self._record_gas, method, shape))
+        receipt_future.add_done_callback(lambda future: rpc_metrics.record(
+            "stage", f"{method}:receipt", time.perf_counter() - sent_at, error=future.exception() is not None))
+        self._on_sent(receipt_future)
+        return PendingTransaction(self.web3, tx_hash, receipt_future, timeout=self.receipt_timeout)
+
+    def _transact_many(self, functions: list, account: eth_account.account.LocalAccount,
+                       gas_price: Optional[int] = None) -> List[PendingTransaction]:
+        """Signs calls with consecutive nonces and sends them in one JSON-RPC batch.
+
+        Raises ``BatchSendError`` with the first rejection and the handles of the accepted
+        transactions, the nonces are resynced with the node then.
+        """
+        transactions = []
+        for function in functions:
+            method = f"{self.contract_name}.{method_name(function)}"
+            transactions.append((method, function, self._build_transaction(method, function, account, None,
+                                                                           gas_price, 0)))
+        for _, _, transaction in transactions:
+            transaction['nonce'] = self.nonce_manager.next_nonce(self.web3, account.address)
+        with rpc_metrics.timed("stage", f"{self.contract_name}.batch:sign"):
+            raw_transactions = sign_many([transaction for _, _, transaction in transactions], account)
+        try:
+            responses = batch_request(self.web3, [("eth_sendRawTransaction", [raw.hex()])
+                                                  for raw in raw_transactions])
+        except BaseException:
+            self.nonce_manager.resync(account.address)
+            raise
+        pending, errors = [], []
+        for (method, function, _), raw, response in zip(transactions, raw_transactions, responses):
+            if "error" in response and is_known_transaction_error(response["error"]):
+                response = {"result": HexBytes(keccak(raw))}
+            if "error" in response:
+                errors.append(response["error"])
+                pending.append(None)
+            else:
+                pending.append(self._watch(method, calldata_shape(function), HexBytes(response["result"])))
+        if errors:
+            self.nonce_manager.resync(account.address)
+            raise BatchSendError(errors, pending)
+        return pending
+
+    def _on_sent(self, receipt_future):
+        """Called for every sent transaction with the future of its receipt."""
+
+    def _record_gas(self, method: str, shape: tuple, receipt_future):
+        if receipt_future.exception() is None:
+            gas_used = receipt_future.result()["gasUsed"]
+            gas_stats.record(method, gas_used)
+            self.fee_strategy.observe(method, shape, gas_used)
+
+    def batch_call(self, contract_address: str, calls: List[Tuple[str, tuple]], block_identifier="latest"):
+        """Runs ``(function_name, args)`` calls of the contract as one JSON-RPC batch.
+
+        Returns decoded results in order, ``None`` for calls that reverted.
+        """
+        contract = self.get_contract_by_address(contract_address)
+        if isinstance(block_identifier, int):
+            block_identifier = hex(block_identifier)
+        requests = [("eth_call", [{"to": contract_address,
+                                   "data": contract.encodeABI(fn_name=name, args=args)},
+                                  block_identifier])
+                    for name, args in calls]
+        results = []
+        for (name, _), response in zip(calls, batch_request(self.web3, requests)):
+            if "error" in response:
+                results.append(None)
+                continue
+            output_types = [output["type"] for output in contract.get_function_by_name(name).abi["outputs"]]
+            decoded = map_abi_data(BASE_RETURN_NORMALIZERS, output_types,
+                                   self.web3.codec.decode_abi(output_types, HexBytes(response["result"])))
+            results.append(decoded[0] if len(decoded) == 1 else decoded)
+        return results
+
 
 class Pedersen(BaseContractWrapper):
-    def __init__(self, rpc_address: str, contract_file: Path):
-        super().__init__(rpc_address, contract_file, "Pedersen")
+    """Pedersen commitments wrapper.
+
+    Commitments are computed off-chain by ``PedersenEngine`` by default. ``mode`` selects
+    where they are computed: ``"local"``, ``"on_chain"`` (``eth_call`` into the contract)
+    or ``"cross_check"`` (both, raising on mismatch).
+    """
+    modes = ("local", "on_chain", "cross_check")
+
+    def __init__(self, rpc_address: str, contract_file: Path, mode: str = "local",
+                 provider: Optional[BaseProvider] = None):
+        super().__init__(rpc_address, contract_file, "Pedersen", provider)
+        if mode not in self.modes:
+            raise ValueError(f"Unknown mode {mode}, expected one of {self.modes}")
+        self.mode = mode
+        self.parameters = None
 
     def deploy(self,
                deploy_account: eth_account.account.LocalAccount,
-               gas=4712388,
-               gas_price=100000000000,
-               q: int = 21888242871839275222246405745257275088696311157297823662689037894645226208583,
-               gX: int = 19823850254741169819033785099293761935467223354323761392354670518001715552183,
-               gY: int = 15097907474011103550430959168661954736283086276546887690628027914974507414020,
-               hX: int = 3184834430741071145030522771540763108892281233703148152311693391954704539228,
-               hY: int = 1405615944858121891163559530323310827496899969303520166098610312148921359100,
+               gas=None,
+               gas_price=None,
+               q: int = DEFAULT_PARAMETERS["q"],
+               gX: int = DEFAULT_PARAMETERS["gX"],
+               gY: int = DEFAULT_PARAMETERS["gY"],
+               hX: int = DEFAULT_PARAMETERS["hX"],
+               hY: int = DEFAULT_PARAMETERS["hY"],
                ) -> str:
         """Deploys contract to blockchain from specific account"""
         contract = self.web3.eth.contract(abi=self.abi, bytecode=self.bytecode)
-        tx_hash = contract.constructor(q,
-                                       gX,
-                                       gY,
-                                       hX,
-                                       hY).buildTransaction(
-            {
-                'gas': gas,
-                'gasPrice': gas_price,
-                'from': deploy_account.address,
-                'nonce': self.web3.eth.get_transaction_count(deploy_account.address, "pending")
-            })
-        signed_txn = self.web3.eth.account.signTransaction(tx_hash, private_key=deploy_account.privateKey)
-        contract_hash = self.web3.eth.sendRawTransaction(signed_txn.rawTransaction)
-        contract_tx_info = self.web3.eth.wait_for_transaction_receipt(contract_hash)
+        contract_tx_info = self._transact(contract.constructor(q,
+                                                               gX,
+                                                               gY,
+                                                               hX,
+                                                               hY), deploy_account, gas, gas_price)
         contract_address = contract_tx_info["contractAddress"]
         self.contact_address = contract_address
+        self.parameters = {"q": q, "gX": gX, "gY": gY, "hX": hX, "hY": hY}
         return contract_address
 
-    def get_dot(self, b: int, r: int):
+    def load_parameters(self) -> dict:
+        """Reads curve parameters from the private storage slots of the deployed contract."""
+        return {name: int.from_bytes(self.web3.eth.get_storage_at(self.contact_address, slot), "big")
+                for slot, name in enumerate(("q", "gX", "gY", "hX", "hY"))}
+
+    @property
+    def engine(self) -> PedersenEngine:
+        if self.parameters is None:
+            self.parameters = self.load_parameters() if self.contact_address else dict(DEFAULT_PARAMETERS)
+        return get_engine(**self.parameters)
+
+    def _call(self, function_name: str, *args):
         contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.Commit(abs(b), abs(r)).call()  # TODO IT Shouldn't be abs!
+        return getattr(contract.functions, function_name)(*args).call()
+
+    def _cross_check(self, local_result, function_name: str, *args):
+        on_chain_result = self._call(function_name, *args)
+        if isinstance(on_chain_result, list):
+            on_chain_result = tuple(on_chain_result)
+        if local_result != on_chain_result:
+            raise RuntimeError(f"{function_name}{args}: local result {local_result} "
+                               f"differs from on-chain result {on_chain_result}")
+
+    def get_dot(self, b: int, r: int):
+        """Commitment ``b*G + r*H``, negative scalars are reduced modulo the curve order."""
+        b, r = b % CURVE_ORDER, r % CURVE_ORDER
+        if self.mode == "on_chain":
+            return self._call("Commit", b, r)
+        dot = self.engine.commit(b, r)
+        if self.mode == "cross_check":
+            self._cross_check(dot, "Commit", b, r)
+        return dot
+
+    def commit_many(self, values: List[int], blindings: List[int], processes: int = 0):
+        """Batch version of ``get_dot``."""
+        values = [b % CURVE_ORDER for b in values]
+        blindings = [r % CURVE_ORDER for r in blindings]
+        if self.mode == "on_chain":
+            return [tuple(self._call("Commit", b, r)) for b, r in zip(values, blindings)]
+        dots = self.engine.commit_many(values, blindings, processes=processes)
+        if self.mode == "cross_check":
+            for dot, b, r in zip(dots, values, blindings):
+                self._cross_check(dot, "Commit", b, r)
+        return dots
 
     def verify(self, b: int, r: int, cX: int, cY: int):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.Verify(b, r, cX, cY).call()
+        if self.mode == "on_chain":
+            return self._call("Verify", b, r, cX, cY)
+        result = self.engine.verify(b, r, cX, cY)
+        if self.mode == "cross_check":
+            self._cross_check(result, "Verify", b, r, cX, cY)
+        return result
 
     def commitDelta(self, cX1: int, cY1: int, cX2: int, cY2: int):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.Verify(cX1, cY1, cX2, cY2).call()
+        if self.mode == "on_chain":
+            return self._call("CommitDelta", cX1, cY1, cX2, cY2)
+        dot = self.engine.commit_delta(cX1, cY1, cX2, cY2)
+        if self.mode == "cross_check":
+            self._cross_check(dot, "CommitDelta", cX1, cY1, cX2, cY2)
+        return dot
 
     def ecMul(self, b: int, cX1: int, cY1: int):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.ecMul(b, cX1, cY1).call()
+        # ecMul is private in the contract, so it is always computed locally.
+        return self.engine.ec_mul(b, cX1, cY1)
 
     def ecAdd(self, cX1: int, cY1: int, cX2: int, cY2: int):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.ecMul(cX1, cY1, cX2, cY2).call()
+        if self.mode == "on_chain":
+            return self._call("ecAdd", cX1, cY1, cX2, cY2)
+        dot = self.engine.ec_add(cX1, cY1, cX2, cY2)
+        if self.mode == "cross_check":
+            self._cross_check(dot, "ecAdd", cX1, cY1, cX2, cY2)
+        return dot
+
+
+@dataclass(frozen=True)
+class BidderSnapshot:
+    address: str
+    commit_x: int
+    commit_y: int
+    cipher: bytes
+    valid_proofs: bool
+    paid_back: bool
+    existing: bool
+
+
+@dataclass(frozen=True)
+class AuctionSnapshot:
+    address: str
+    block_number: int
+    state: str
+    number_zkp: int
+    max_bid: int
+    auctioneer_address: str
+    bid_block_number: int
+    reveal_block_number: int
+    winner_payment_block_number: int
+    max_bidders_count: int
+    fairness_fees: int
+    winner: str
+    highest_bid: int
+    pedersen_address: str
+    bidders: Tuple[BidderSnapshot, ...]
 
 
 class BlindAuction(BaseContractWrapper):
-    def __init__(self, rpc_address: str, contract_file: Path):
-        super().__init__(rpc_address, contract_file, "BlindAuction")
+    # snapshot field -> contract getter
+    index_page_size = 256
+    snapshot_fields = {
+        "state": "states",
+        "number_zkp": "number_zkp",
+        "max_bid": "maxBid",
+        "auctioneer_address": "auctioneerAddress",
+        "bid_block_number": "bidBlockNumber",
+        "reveal_block_number": "revealBlockNumber",
+        "winner_payment_block_number": "winnerPaymentBlockNumber",
+        "max_bidders_count": "maxBiddersCount",
+        "fairness_fees": "fairnessFees",
+        "winner": "winner",
+        "highest_bid": "highestBid",
+        "pedersen_address": "getPedersenAddr",
+    }
+    # headroom kept in every ZKPVerifyBatch chunk over the measured gas per bidder
+    batch_gas_margin = 1.2
+    # Read-through caches shared by all wrappers. Values set by the constructor are kept
+    # for the lifetime of the contract, other fields for one block: address -> {getter: value}
+    # and address -> {getter: (block number, value)}.
+    immutable_cache = LRUCache(4096)
+    block_cache = LRUCache(4096)
+    # address -> number of sent transactions of this process whose receipts are pending
+    _in_flight: Dict[str, int] = {}
+    _in_flight_lock = threading.Lock()
+
+    def __init__(self, rpc_address: str, contract_file: Path, provider: Optional[BaseProvider] = None):
+        super().__init__(rpc_address, contract_file, "BlindAuction", provider)
+        self._pedersen: Optional[Pedersen] = None
+
+    def _immutable(self, getter: str):
+        values = self.immutable_cache.get(self.contact_address)
+        if values is None:
+            values = {}
+            self.immutable_cache.put(self.contact_address, values)
+        if getter not in values:
+            values[getter] = self.get_contract_by_address(self.contact_address).functions[getter]().call()
+        return values[getter]
+
+    def _per_block(self, getter: str):
+        """Value of a mutable field, read at most once per block.
+
+        The cache is bypassed while transactions sent to the auction are not mined yet.
+        """
+        function = self.get_contract_by_address(self.contact_address).functions[getter]()
+        if self._in_flight.get(self.contact_address):
+            return function.call()
+        block_number = self.block_clock.current()
+        values = self.block_cache.get(self.contact_address)
+        if values is None:
+            values = {}
+            self.block_cache.put(self.contact_address, values)
+        cached = values.get(getter)
+        if cached is None or cached[0] != block_number:
+            cached = values[getter] = (block_number, function.call(block_identifier=block_number))
+        return cached[1]
+
+    def _on_sent(self, receipt_future):
+        address = self.contact_address
+        if address is None:  # constructor
+            return
+        with self._in_flight_lock:
+            self._in_flight[address] = self._in_flight.get(address, 0) + 1
+        self.block_cache.pop(address)
+        receipt_future.add_done_callback(partial(self._on_mined, address))
+
+    def _on_mined(self, address: str, receipt_future):
+        if receipt_future.exception() is None:
+            self.block_clock.observe(receipt_future.result()["blockNumber"])
+        self.block_cache.pop(address)
+        with self._in_flight_lock:
+            self._in_flight[address] -= 1
+            if not self._in_flight[address]:
+                del self._in_flight[address]
+
+    def snapshot(self, block_identifier: Optional[int] = None) -> AuctionSnapshot:
+        """Reads all public auction state and bidders pinned to one block.
+
+        Uses a constant number of JSON-RPC batches (block number, fields, ``indexs``,
+        ``bidders``) instead of one request per field. Raises ``StateUnavailableError`` if
+        the node cannot serve the state at ``block_identifier``.
+        """
+        if block_identifier is None:
+            block_identifier = self.web3.eth.block_number
+        *fields, bidders_count = self.batch_call(self.contact_address,
+                                                 [(getter, ()) for getter in self.snapshot_fields.values()]
+                                                 + [("biddersCount", ())],
+                                                 block_identifier)
+        if any(value is None for value in fields):  # e.g. historical state on a non-archive node
+            raise StateUnavailableError(f"State of {self.contact_address} at block {block_identifier} "
+                                        f"is unavailable")
+        values = dict(zip(self.snapshot_fields, fields))
+        values["state"] = STATES[values["state"]]
+        addresses = self._bidder_addresses(bidders_count, block_identifier)
+        bidders = tuple(BidderSnapshot(address, *bidder)
+                        for address, bidder in zip(addresses,
+                                                   self.batch_call(self.contact_address,
+                                                                   [("bidders", (a,)) for a in addresses],
+                                                                   block_identifier)))
+        return AuctionSnapshot(address=self.contact_address, block_number=block_identifier,
+                               bidders=bidders, **values)
+
+    def _bidder_addresses(self, bidders_count: Optional[int], block_identifier) -> List[str]:
+        """``indexs`` entries. Contracts deployed without ``biddersCount`` (``None``) are read
+        in pages of ``index_page_size`` until the first index out of range."""
+        if bidders_count is not None:
+            return [address for address in self.batch_call(self.contact_address,
+                                                           [("indexs", (i,)) for i in range(bidders_count)],
+                                                           block_identifier)
+                    if address is not None]
+        addresses = []
+        while True:
+            page = self.batch_call(self.contact_address,
+                                   [("indexs", (i,)) for i in range(len(addresses),
+                                                                    len(addresses) + self.index_page_size)],
+                                   block_identifier)
+            for address in page:
+                if address is None:  # out of range of indexs
+                    return addresses
+                addresses.append(address)
 
     def deploy(self,
                maxBid: int,
@@ -109,49 +488,35 @@ class BlindAuction(BaseContractWrapper):
                testing: bool,
                eth_pay_value: int,
                deploy_account: eth_account.account.LocalAccount,
-               gas=4712388,
-               gas_price=100000000000) -> str:
+               gas=None,
+               gas_price=None) -> str:
         """Deploys contract to blockchain from specific account"""
         contract = self.web3.eth.contract(abi=self.abi, bytecode=self.bytecode)
-        tx_hash = contract.constructor(maxBid,
-                                       bidBlockNumber,
-                                       revealBlockNumber,
-                                       winnerPaymentBlockNumber,
-                                       maxBiddersCount,
-                                       fairnessFees,
-                                       pedersenAddress,
-                                       k,
-                                       testing).buildTransaction(
-            {
-                'gas': gas,
-                'gasPrice': gas_price,
-                'from': deploy_account.address,
-                'nonce': self.web3.eth.get_transaction_count(deploy_account.address, "pending"),
-                "value": eth_pay_value
-            })
-        signed_txn = self.web3.eth.account.signTransaction(tx_hash, private_key=deploy_account.privateKey)
-        contract_hash = self.web3.eth.sendRawTransaction(signed_txn.rawTransaction)
-        contract_tx_info = self.web3.eth.wait_for_transaction_receipt(contract_hash)
+        contract_tx_info = self._transact(contract.constructor(maxBid,
+                                                               bidBlockNumber,
+                                                               revealBlockNumber,
+                                                               winnerPaymentBlockNumber,
+                                                               maxBiddersCount,
+                                                               fairnessFees,
+                                                               pedersenAddress,
+                                                               k,
+                                                               testing), deploy_account, gas, gas_price,
+                                          value=eth_pay_value)
         contract_address = contract_tx_info["contractAddress"]
         self.contact_address = contract_address
         return contract_address
 
     @property
     def number_zkp(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.number_zkp().call()
+        return self._per_block("number_zkp")
 
     @property
     def max_bid(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.maxBid().call()
+        return self._immutable("maxBid")
 
     @property
     def states(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        state = contract.functions.states().call()
-        states = ["Init", "Challenge", "ChallengeDelta", "Verify", "VerifyDelta", "ValidWinner"]
-        return states[state]
+        return STATES[self._per_block("states")]
 
     @property
     def is_withdraw_lock(self):
@@ -160,216 +525,289 @@ class BlindAuction(BaseContractWrapper):
 
     @property
     def auctioneer_address(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.auctioneerAddress().call()
+        return self._immutable("auctioneerAddress")
 
     @property
     def bid_block_number(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.bidBlockNumber().call()
+        return self._immutable("bidBlockNumber")
 
     @property
     def reveal_block_number(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.revealBlockNumber().call()
+        return self._immutable("revealBlockNumber")
 
     @property
     def winner_payment_block_number(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.winnerPaymentBlockNumber().call()
+        return self._immutable("winnerPaymentBlockNumber")
 
     @property
     def max_bidders_count(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.maxBiddersCount().call()
+        return self._immutable("maxBiddersCount")
 
     @property
     def fairness_fees(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.fairnessFees().call()
+        return self._immutable("fairnessFees")
 
     @property
     def winner(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.winner().call()
+        return self._per_block("winner")
 
     @property
     def pedersen(self) -> Pedersen:
-        contract = self.get_contract_by_address(self.contact_address)
-        ped = Pedersen(self.rpc_address, self.contract_file)
-        ped.contact_address = contract.functions.getPedersenAddr().call()
-        return ped
+        address = self._immutable("getPedersenAddr")
+        if self._pedersen is None or self._pedersen.contact_address != address:
+            ped = Pedersen(self.rpc_address, self.contract_file, provider=self.web3.provider)
+            ped.contact_address = address
+            self._pedersen = ped
+        return self._pedersen
 
     @property
     def highest_bid(self):
-        contract = self.get_contract_by_address(self.contact_address)
-        return contract.functions.highestBid().call()
+        return self._per_block("highestBid")
+
+    @property
+    def bidders_count(self):
+        return self._per_block("biddersCount")
 
     def bid(self, cX: int, cY: int, bid_amount_wei: int,
             account: eth_account.account.LocalAccount,
-            gas=4712388,
-            gas_price=100000000000):
+            gas=None,
+            gas_price=None,
+            wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.Bid(
-            cX, cY
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-            "value": bid_amount_wei
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.Bid(cX, cY), account, gas, gas_price,
+                              value=bid_amount_wei, wait=wait)
 
     def reveal(self, cipher: bytes,
                account: eth_account.account.LocalAccount,
-               gas=4712388,
-               gas_price=100000000000):
+               gas=None,
+               gas_price=None,
+               wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.Reveal(
-            cipher
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.Reveal(cipher), account, gas, gas_price, wait=wait)
 
     def zkp_commit(self, y: str,
                    commits: List[int],
                    account: eth_account.account.LocalAccount,
-                   gas=4712388,
-                   gas_price=100000000000):
+                   gas=None,
+                   gas_price=None,
+                   wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.ZKPCommit(
-            y, commits
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.ZKPCommit(y, commits), account, gas, gas_price, wait=wait)
 
     def zkp_verify(self,
                    response: List[int],
                    account: eth_account.account.LocalAccount,
-                   gas=4712388,
-                   gas_price=100000000000):
+                   gas=None,
+                   gas_price=None,
+                   wait: bool = True):
+        contract = self.get_contract_by_address(self.contact_address)
+        return self._transact(contract.functions.ZKPVerify(response), account, gas, gas_price, wait=wait)
+
+    def zkp_challenge(self) -> Optional[Tuple[str, List[int]]]:
+        """``(bidder, commits)`` stored by the last ``ZKPCommit``, read from the chain.
+
+        Returns None for auctions deployed without ``zkpChallenge``.
+        """
+        contract = self.get_contract_by_address(self.contact_address)
+        try:
+            bidder, commits = contract.functions.zkpChallenge().call()
+        except (BadFunctionCallOutput, ContractLogicError, ValueError):
+            return None
+        return bidder, list(commits)
+
+    def preverify(self, proofs: List[Tuple[str, List[int], List[int]]], k: Optional[int] = None,
+                  processes: int = 0):
+        """Checks ``(bidder, commits, response)`` proofs locally against the stored bidder commitments.
+
+        Raises ``InvalidProofError`` with the reason for every proof the contract would reject.
+        ``k`` defaults to the number of rounds in the commits of the first proof.
+        """
+        if not proofs:
+            return
+        if k is None:
+            k = len(proofs[0][1]) // 4
+        reasons = {}
+        candidates = []
+        bidders = self.batch_call(self.contact_address, [("bidders", (address,)) for address, _, _ in proofs])
+        for (address, commits, response), bidder in zip(proofs, bidders):
+            if bidder is None or not bidder[5]:  # Bidder.existing
+                reasons[address] = "not a bidder of the auction"
+            else:
+                candidates.append((address, (bidder[0], bidder[1]), commits, response))
+        checked = check_proofs(self.pedersen.engine.parameters,
+                               [(commitment, commits, response) for _, commitment, commits, response in candidates],
+                               k, processes)
+        for (address, _, _, _), reason in zip(candidates, checked):
+            if reason is not None:
+                reasons[address] = reason
+        if reasons:
+            raise InvalidProofError(reasons)
+
+    def zkp_commit_verify(self, y: str,
+                          commits: List[int],
+                          response: List[int],
+                          account: eth_account.account.LocalAccount,
+                          gas=None,
+                          gas_price=None,
+                          wait: bool = True,
+                          preverify: bool = True):
+        """Commits and verifies all rounds of the proof of ``y`` in one transaction.
+
+        With ``preverify`` the proof is checked locally first and ``InvalidProofError`` is
+        raised instead of sending a transaction that would revert.
+        """
+        if preverify:
+            self.preverify([(y, commits, response)])
+        contract = self.get_contract_by_address(self.contact_address)
+        return self._transact(contract.functions.ZKPCommitVerify(y, commits, response), account, gas, gas_price,
+                              wait=wait)
+
+    def zkp_verify_batch(self, proofs: List[Tuple[str, List[int], List[int]]],
+                         account: eth_account.account.LocalAccount,
+                         gas_limit: Optional[int] = None,
+                         gas_price=None,
+                         wait: bool = True,
+                         preverify: bool = True,
+                         processes: int = 0) -> list:
+        """Verifies ``(bidder, commits, response)`` proofs with as few ``ZKPVerifyBatch`` calls as possible.
+
+        Proofs are split into chunks whose gas fits ``gas_limit`` (half of the block gas limit
+        by default). Gas per bidder is taken from mined batches, or estimated from a batch of
+        one bidder before the first one. Several chunks are signed together and sent in one
+        JSON-RPC batch. Returns receipts of all chunks, or ``PendingTransaction`` handles if
+        ``wait`` is False.
+
+        With ``preverify`` all proofs are checked locally first (across ``processes`` worker
+        processes) and ``InvalidProofError`` is raised before anything is sent.
+        """
+        if not proofs:
+            return []
+        if preverify:
+            self.preverify(proofs, processes=processes)
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.ZKPVerify(
-            response
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        if gas_limit is None:
+            gas_limit = self.web3.eth.get_block("latest")["gasLimit"] // 2
+        per_bidder_method = f"{self.contract_name}.ZKPVerifyBatch[K={len(proofs[0][1]) // 4}]/bidder"
+        per_bidder = gas_stats.mean(per_bidder_method)
+        if per_bidder is None:
+            per_bidder = self._batch_function(contract, proofs[:1]).estimateGas({'from': account.address})
+        chunk_size = max(1, int(gas_limit // (per_bidder * self.batch_gas_margin)))
+        chunks = [proofs[i:i + chunk_size] for i in range(0, len(proofs), chunk_size)]
+        if len(chunks) == 1:
+            pending = [self._transact(self._batch_function(contract, chunks[0]), account, None, gas_price,
+                                      wait=False)]
+        else:
+            try:
+                pending = self._transact_many([self._batch_function(contract, chunk) for chunk in chunks],
+                                              account, gas_price)
+            except BatchSendError as e:
+                self._watch_batch_gas(e.pending, chunks, per_bidder_method)
+                raise
+        self._watch_batch_gas(pending, chunks, per_bidder_method)
+        return wait_all(pending, timeout=self.receipt_timeout) if wait else pending
+
+    def _watch_batch_gas(self, pending: list, chunks: list, per_bidder_method: str):
+        for transaction, chunk in zip(pending, chunks):
+            if transaction is not None:
+                transaction.receipt_future.add_done_callback(partial(self._record_batch_gas, per_bidder_method,
+                                                                     len(chunk)))
+
+    @staticmethod
+    def _batch_function(contract, proofs: List[Tuple[str, List[int], List[int]]]):
+        return contract.functions.ZKPVerifyBatch([address for address, _, _ in proofs],
+                                                 [c for _, commits, _ in proofs for c in commits],
+                                                 [r for _, _, response in proofs for r in response])
+
+    @staticmethod
+    def _record_batch_gas(method: str, bidders_count: int, receipt_future):
+        if receipt_future.exception() is None:
+            gas_stats.record(method, receipt_future.result()["gasUsed"] // bidders_count)
 
     def verify_all(self,
                    account: eth_account.account.LocalAccount,
-                   gas=4712388,
-                   gas_price=100000000000):
+                   gas=None,
+                   gas_price=None,
+                   wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.VerifyAll(
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.VerifyAll(), account, gas, gas_price, wait=wait)
 
     def claim_winner(self,
                      winner: str,
                      bid: int,
                      r: int,
                      account: eth_account.account.LocalAccount,
-                     gas=4712388,
-                     gas_price=100000000000):
+                     gas=None,
+                     gas_price=None,
+                     wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.ClaimWinner(
-            winner, bid, r
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.ClaimWinner(winner, bid, r), account, gas, gas_price, wait=wait)
 
     def withdraw(self, account: eth_account.account.LocalAccount,
-                 gas=4712388,
-                 gas_price=100000000000):
+                 gas=None,
+                 gas_price=None,
+                 wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.Withdraw(
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-            'value': 1
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.Withdraw(), account, gas, gas_price, value=1, wait=wait)
 
     def winner_pay(self, account: eth_account.account.LocalAccount,
-                   gas=4712388,
-                   gas_price=100000000000):
+                   gas=None,
+                   gas_price=None,
+                   wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.WinnerPay(
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-            'value': 1
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.WinnerPay(), account, gas, gas_price, value=1, wait=wait)
 
     def destroy(self, account: eth_account.account.LocalAccount,
-                gas=4712388,
-                gas_price=100000000000):
+                gas=None,
+                gas_price=None,
+                wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.Destroy(
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.Destroy(), account, gas, gas_price, wait=wait)
 
     def challenge_by_auctioneer(self, account: eth_account.account.LocalAccount,
-                                gas=4712388,
-                                gas_price=100000000000):
+                                gas=None,
+                                gas_price=None,
+                                wait: bool = True):
+        contract = self.get_contract_by_address(self.contact_address)
+        return self._transact(contract.functions.challengeByAuctioneer(), account, gas, gas_price, wait=wait)
+
+
+class AuctionsBox(BaseContractWrapper):
+    def __init__(self, rpc_address: str, contract_file: Path, provider: Optional[BaseProvider] = None):
+        super().__init__(rpc_address, contract_file, "AuctionsBox", provider)
+
+    def deploy(self,
+               deploy_account: eth_account.account.LocalAccount,
+               gas=None,
+               gas_price=None) -> str:
+        """Deploys contract to blockchain from specific account"""
+        contract = self.web3.eth.contract(abi=self.abi, bytecode=self.bytecode)
+        contract_tx_info = self._transact(contract.constructor(), deploy_account, gas, gas_price)
+        contract_address = contract_tx_info["contractAddress"]
+        self.contact_address = contract_address
+        return contract_address
+
+    @property
+    def admin(self):
+        contract = self.get_contract_by_address(self.contact_address)
+        return contract.functions.admin().call()
+
+    def get_all(self) -> List[str]:
+        """Addresses of opened auctions, closed ones are zero addresses."""
+        contract = self.get_contract_by_address(self.contact_address)
+        return contract.functions.getAll().call()
+
+    def add_auction(self, auction_address: str,
+                    account: eth_account.account.LocalAccount,
+                    gas=None,
+                    gas_price=None,
+                    wait: bool = True):
+        contract = self.get_contract_by_address(self.contact_address)
+        return self._transact(contract.functions.addAuction(auction_address), account, gas, gas_price, wait=wait)
+
+    def close_auction(self, idx: int,
+                      account: eth_account.account.LocalAccount,
+                      gas=None,
+                      gas_price=None,
+                      wait: bool = True):
         contract = self.get_contract_by_address(self.contact_address)
-        transaction = contract.functions.challengeByAuctioneer(
-        ).buildTransaction({
-            'gas': gas,
-            'gasPrice': gas_price,
-            'from': account.address,
-            'nonce': self.web3.eth.get_transaction_count(account.address),
-        })
-        signed_txn = self.web3.eth.account.signTransaction(transaction,
-                                                           private_key=account.privateKey)
-        return self.web3.eth.wait_for_transaction_receipt(self.web3.eth.sendRawTransaction(signed_txn.rawTransaction))
+        return self._transact(contract.functions.closeAuction(idx), account, gas, gas_price, wait=wait)
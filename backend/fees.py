@@ -0,0 +1,136 @@
+"""Gas limit and fee selection for the wrapper transactions."""
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+import web3
+
+GAS_BUCKETS = (21000, 50000, 100000, 200000, 500000, 1000000, 2000000, 5000000, float("inf"))
+
+
+def calldata_shape(function) -> Tuple[Optional[int], ...]:
+    """Lengths of the array, bytes and string arguments of a call.
+
+    Gas of the looping contract methods grows with these lengths, so calls of the same
+    shape share a gas estimate.
+    """
+    if not hasattr(function, "args"):  # constructor, bytecode + arguments
+        return (len(function.data_in_transaction),)
+    return tuple(len(arg) if isinstance(arg, (list, tuple, bytes, str)) else None
+                 for arg in (*function.args, *function.kwargs.values()))
+
+
+def method_name(function) -> str:
+    return getattr(function, "fn_name", "constructor")
+
+
+class GasStats:
+    """Histogram of gas used by mined transactions per contract method."""
+
+    def __init__(self, buckets: Tuple[float, ...] = GAS_BUCKETS):
+        self.buckets = buckets
+        self._stats: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, gas_used: int):
+        with self._lock:
+            stats = self._stats.setdefault(method, {"count": 0, "total": 0, "max": 0,
+                                                    "histogram": [0] * len(self.buckets)})
+            stats["count"] += 1
+            stats["total"] += gas_used
+            stats["max"] = max(stats["max"], gas_used)
+            stats["histogram"][next(i for i, bound in enumerate(self.buckets) if gas_used <= bound)] += 1
+
+    def mean(self, method: str) -> Optional[float]:
+        stats = self._stats.get(method)
+        return stats["total"] / stats["count"] if stats else None
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {method: {"count": stats["count"],
+                             "mean": stats["total"] / stats["count"],
+                             "max": stats["max"],
+                             "histogram": {str(bound): n for bound, n in zip(self.buckets, stats["histogram"])}}
+                    for method, stats in self._stats.items()}
+
+
+gas_stats = GasStats()
+
+
+class FeeStrategy:
+    """Chooses ``gas`` and fee fields of a transaction."""
+
+    def gas(self, web3_instance: web3.Web3, method: str, function, transaction: dict) -> int:
+        raise NotImplementedError
+
+    def fees(self, web3_instance: web3.Web3) -> dict:
+        raise NotImplementedError
+
+    def observe(self, method: str, shape: tuple, gas_used: int):
+        """Called with gas used by every mined transaction sent with this strategy."""
+
+
+class FixedFeeStrategy(FeeStrategy):
+    """Same gas limit and legacy gas price for every transaction."""
+
+    def __init__(self, gas: int = 4712388, gas_price: int = 100000000000):
+        self._gas = gas
+        self._gas_price = gas_price
+
+    def gas(self, web3_instance, method, function, transaction):
+        return self._gas
+
+    def fees(self, web3_instance):
+        return {'gasPrice': self._gas_price}
+
+
+class EstimatingFeeStrategy(FeeStrategy):
+    """Estimated gas limits cached per method and ``calldata_shape``, node-suggested fees.
+
+    Estimates run against the pending block, so a call may depend on transactions that
+    are sent but not mined yet. They are multiplied by ``margin`` and raised whenever a
+    mined transaction of the same shape used more. EIP-1559 fee fields are used when the latest block has a base
+    fee, ``gasPrice`` otherwise. Fees are cached for ``fee_ttl`` seconds.
+    """
+
+    def __init__(self, margin: float = 1.2, max_fee_multiplier: int = 2,
+                 priority_fee: Optional[int] = None, fee_ttl: float = 2.0):
+        self.margin = margin
+        self.max_fee_multiplier = max_fee_multiplier
+        self.priority_fee = priority_fee
+        self.fee_ttl = fee_ttl
+        self._estimates: Dict[Tuple[str, tuple], int] = {}
+        self._fees: Optional[dict] = None
+        self._fees_time = 0.0
+        self._lock = threading.Lock()
+
+    def gas(self, web3_instance, method, function, transaction):
+        key = (method, calldata_shape(function))
+        estimate = self._estimates.get(key)
+        if estimate is None:
+            estimate = function.estimateGas({'from': transaction['from'], 'value': transaction.get('value', 0)},
+                                            block_identifier="pending")
+            with self._lock:
+                estimate = self._estimates[key] = max(estimate, self._estimates.get(key, 0))
+        return int(estimate * self.margin)
+
+    def observe(self, method, shape, gas_used):
+        key = (method, shape)
+        with self._lock:
+            if gas_used > self._estimates.get(key, 0):
+                self._estimates[key] = gas_used
+
+    def fees(self, web3_instance):
+        now = time.monotonic()
+        if self._fees is None or now - self._fees_time > self.fee_ttl:
+            base_fee = web3_instance.eth.get_block("latest").get("baseFeePerGas")
+            if base_fee is None:
+                fees = {'gasPrice': web3_instance.eth.gas_price}
+            else:
+                priority_fee = self.priority_fee
+                if priority_fee is None:
+                    priority_fee = web3_instance.eth.max_priority_fee
+                fees = {'maxFeePerGas': base_fee * self.max_fee_multiplier + priority_fee,
+                        'maxPriorityFeePerGas': priority_fee}
+            self._fees, self._fees_time = fees, now
+        return dict(self._fees)
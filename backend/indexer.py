@@ -0,0 +1,251 @@
+"""Event indexer keeping a local SQLite view of all auctions of an ``AuctionsBox``.
+
+The indexer follows ``AuctionsBox``/``BlindAuction`` logs block range by block range.
+Immutable parameters of an auction are read once when its ``AuctionAdded`` event is
+seen. After that, state changes come only from events, so listing auctions never
+touches the chain.
+"""
+import logging
+import sqlite3
+import threading
+from typing import List, Optional, Tuple
+
+from eth_utils import event_abi_to_log_topic
+from web3._utils.events import get_event_data
+
+from backend.evm_wrapper import AuctionsBox, BlindAuction, StateUnavailableError
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS auctions (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    address TEXT NOT NULL UNIQUE,
+    idx INTEGER,
+    auctioneer TEXT,
+    state TEXT,
+    winner TEXT,
+    highest_bid TEXT,
+    max_bid TEXT,
+    fairness_fees TEXT,
+    bid_block_number INTEGER,
+    reveal_block_number INTEGER,
+    winner_payment_block_number INTEGER,
+    max_bidders_count INTEGER,
+    bidders_count INTEGER NOT NULL DEFAULT 0,
+    closed INTEGER NOT NULL DEFAULT 0,
+    added_block INTEGER,
+    updated_block INTEGER
+);
+CREATE INDEX IF NOT EXISTS auctions_state ON auctions (state, id);
+CREATE INDEX IF NOT EXISTS auctions_auctioneer ON auctions (auctioneer, id);
+CREATE INDEX IF NOT EXISTS auctions_added_block ON auctions (added_block, id);
+CREATE TABLE IF NOT EXISTS bidders (
+    auction TEXT NOT NULL,
+    address TEXT NOT NULL,
+    commit_x TEXT,
+    commit_y TEXT,
+    revealed INTEGER NOT NULL DEFAULT 0,
+    valid_proofs INTEGER NOT NULL DEFAULT 0,
+    paid_back INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (auction, address)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+AUCTION_COLUMNS = ("id", "address", "idx", "auctioneer", "state", "winner", "highest_bid", "max_bid",
+                   "fairness_fees", "bid_block_number", "reveal_block_number", "winner_payment_block_number",
+                   "max_bidders_count", "bidders_count", "closed", "added_block", "updated_block")
+
+
+class AuctionStore:
+    """SQLite storage of indexed auctions, safe to share between threads."""
+
+    def __init__(self, path: str = ":memory:"):
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._connection:
+            self._connection.executescript(SCHEMA)
+
+    def execute(self, sql: str, params=()) -> List[tuple]:
+        with self._lock, self._connection:
+            return self._connection.execute(sql, params).fetchall()
+
+    @property
+    def last_block(self) -> Optional[int]:
+        rows = self.execute("SELECT value FROM meta WHERE key = 'last_block'")
+        return int(rows[0][0]) if rows else None
+
+    @last_block.setter
+    def last_block(self, block_number: int):
+        self.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_block', ?)", (str(block_number),))
+
+    def is_known(self, address: str) -> bool:
+        return bool(self.execute("SELECT 1 FROM auctions WHERE address = ?", (address,)))
+
+    def add_auction(self, snapshot, idx: int, block_number: int):
+        self.execute("""INSERT OR IGNORE INTO auctions
+                        (address, idx, auctioneer, state, winner, highest_bid, max_bid, fairness_fees,
+                         bid_block_number, reveal_block_number, winner_payment_block_number,
+                         max_bidders_count, added_block, updated_block)
+                        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                     (snapshot.address, idx, snapshot.auctioneer_address, snapshot.state, snapshot.winner,
+                      str(snapshot.highest_bid), str(snapshot.max_bid), str(snapshot.fairness_fees),
+                      snapshot.bid_block_number, snapshot.reveal_block_number,
+                      snapshot.winner_payment_block_number, snapshot.max_bidders_count,
+                      block_number, block_number))
+        for bidder in snapshot.bidders:
+            self.execute("""INSERT OR IGNORE INTO bidders
+                            (auction, address, commit_x, commit_y, revealed, valid_proofs, paid_back)
+                            VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                         (snapshot.address, bidder.address, str(bidder.commit_x), str(bidder.commit_y),
+                          int(bool(bidder.cipher)), int(bidder.valid_proofs), int(bidder.paid_back)))
+        self._refresh_bidders_count(snapshot.address)
+
+    def update_auction(self, address: str, block_number: int, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.execute(f"UPDATE auctions SET {assignments}, updated_block = ? WHERE address = ?",
+                     (*fields.values(), block_number, address))
+
+    def add_bidder(self, auction: str, bidder: str, commit_x: int, commit_y: int):
+        self.execute("INSERT OR IGNORE INTO bidders (auction, address, commit_x, commit_y) VALUES (?, ?, ?, ?)",
+                     (auction, bidder, str(commit_x), str(commit_y)))
+        self._refresh_bidders_count(auction)
+
+    def update_bidder(self, auction: str, bidder: str, **fields):
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        self.execute(f"UPDATE bidders SET {assignments} WHERE auction = ? AND address = ?",
+                     (*fields.values(), auction, bidder))
+
+    def _refresh_bidders_count(self, auction: str):
+        self.execute("UPDATE auctions SET bidders_count = (SELECT COUNT(*) FROM bidders WHERE auction = ?) "
+                     "WHERE address = ?", (auction, auction))
+
+    def list_auctions(self, limit: int = 50, cursor: Optional[int] = None, state: Optional[str] = None,
+                      auctioneer: Optional[str] = None, from_block: Optional[int] = None,
+                      to_block: Optional[int] = None, include_closed: bool = False) -> Tuple[List[dict], Optional[int]]:
+        """Returns page of auctions ordered by id and cursor of the next page.
+
+        Keyset pagination over the indexed columns keeps every page O(limit).
+        """
+        conditions, params = [], []
+        if cursor is not None:
+            conditions.append("id > ?")
+            params.append(cursor)
+        if state is not None:
+            conditions.append("state = ?")
+            params.append(state)
+        if auctioneer is not None:
+            conditions.append("auctioneer = ?")
+            params.append(auctioneer)
+        if from_block is not None:
+            conditions.append("added_block >= ?")
+            params.append(from_block)
+        if to_block is not None:
+            conditions.append("added_block <= ?")
+            params.append(to_block)
+        if not include_closed:
+            conditions.append("closed = 0")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = self.execute(f"SELECT {', '.join(AUCTION_COLUMNS)} FROM auctions {where} ORDER BY id LIMIT ?",
+                            (*params, limit + 1))
+        next_cursor = rows[limit - 1][0] if len(rows) > limit else None
+        return [dict(zip(AUCTION_COLUMNS, row)) for row in rows[:limit]], next_cursor
+
+
+class AuctionIndexer:
+    """Follows new blocks and applies ``AuctionsBox``/``BlindAuction`` events to ``AuctionStore``."""
+
+    def __init__(self, auctions_box: AuctionsBox, auction: BlindAuction, store: AuctionStore,
+                 start_block: int = 0, confirmations: int = 0, max_block_range: int = 1000,
+                 poll_interval: float = 2.0):
+        self.auctions_box = auctions_box
+        self.auction = auction
+        self.store = store
+        self.start_block = start_block
+        self.confirmations = confirmations
+        self.max_block_range = max_block_range
+        self.poll_interval = poll_interval
+        self.web3 = auctions_box.web3
+        self._events = {}
+        for contract_name, abi in (("AuctionsBox", auctions_box.abi), ("BlindAuction", auction.abi)):
+            for event_abi in abi:
+                if event_abi["type"] == "event":
+                    self._events["0x" + event_abi_to_log_topic(event_abi).hex()] = (contract_name, event_abi)
+        self._stop = threading.Event()
+        self._thread = None
+
+    def sync(self) -> int:
+        """Indexes all blocks up to the latest confirmed one, returns the last indexed block."""
+        head = self.web3.eth.block_number - self.confirmations
+        last_block = self.store.last_block
+        from_block = self.start_block if last_block is None else last_block + 1
+        while from_block <= head:
+            to_block = min(head, from_block + self.max_block_range - 1)
+            logs = self.web3.eth.get_logs({"fromBlock": from_block, "toBlock": to_block,
+                                           "topics": [list(self._events)]})
+            for log in sorted(logs, key=lambda log: (log["blockNumber"], log["logIndex"])):
+                self._apply(log)
+            self.store.last_block = to_block
+            from_block = to_block + 1
+        return self.store.last_block
+
+    def _apply(self, log):
+        contract_name, event_abi = self._events[log["topics"][0].hex()]
+        address = log["address"]
+        if contract_name == "AuctionsBox":
+            if address != self.auctions_box.contact_address:
+                return
+        elif not self.store.is_known(address):
+            return
+        event = get_event_data(self.web3.codec, event_abi, log)
+        args, block_number = event["args"], log["blockNumber"]
+        name = event["event"]
+        if name == "AuctionAdded":
+            self.auction.contact_address = args["auction"]
+            try:
+                snapshot = self.auction.snapshot(block_number)
+            except StateUnavailableError:
+                # pruned node, the events that follow bring the latest state back to this block
+                logger.info("State at block %s is unavailable, reading %s at the latest block",
+                            block_number, args["auction"])
+                snapshot = self.auction.snapshot()
+            self.store.add_auction(snapshot, args["idx"], block_number)
+        elif name == "AuctionClosed":
+            self.store.update_auction(args["auction"], block_number, closed=1)
+        elif name == "BidPlaced":
+            self.store.add_bidder(address, args["bidder"], args["cX"], args["cY"])
+        elif name == "Revealed":
+            self.store.update_bidder(address, args["bidder"], revealed=1)
+        elif name == "ZKPCommitted":
+            self.store.update_auction(address, block_number, state="Verify")
+        elif name == "ZKPVerified":
+            self.store.update_bidder(address, args["bidder"], valid_proofs=1)
+        elif name == "WinnerClaimed":
+            self.store.update_auction(address, block_number, state="Challenge",
+                                      winner=args["winner"], highest_bid=str(args["bid"]))
+        elif name == "AllVerified":
+            self.store.update_auction(address, block_number, state="ValidWinner")
+        elif name == "Withdrawn":
+            self.store.update_bidder(address, args["bidder"], paid_back=1)
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="auction-indexer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.sync()
+            except Exception:
+                logger.exception("Indexer sync failed")
+            self._stop.wait(self.poll_interval)
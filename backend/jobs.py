@@ -0,0 +1,67 @@
+"""Background jobs for long-running chain operations (deploys, verification)."""
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class Job:
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.status = "pending"
+        self.result: Any = None
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    def as_dict(self) -> dict:
+        return {"id": self.id, "name": self.name, "status": self.status, "result": self.result,
+                "error": self.error, "created_at": self.created_at, "finished_at": self.finished_at}
+
+
+class JobManager:
+    """Runs jobs on a thread pool and keeps their status for polling."""
+
+    def __init__(self, max_workers: int = 4, keep_finished: int = 10000):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        self.keep_finished = keep_finished
+
+    def submit(self, name: str, fn: Callable, *args, **kwargs) -> Job:
+        job = Job(name)
+        with self._lock:
+            self._jobs[job.id] = job
+            self._evict()
+        self._executor.submit(self._run, job, fn, args, kwargs)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self._jobs.get(job_id)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+    @staticmethod
+    def _run(job: Job, fn: Callable, args, kwargs):
+        job.status = "running"
+        try:
+            job.result = fn(*args, **kwargs)
+            job.status = "done"
+        except Exception as e:
+            job.error = f"{type(e).__name__}: {e}"
+            job.status = "failed"
+            logger.exception("Job %s (%s) failed", job.id, job.name)
+        job.finished_at = time.time()
+
+    def _evict(self):
+        finished = [job for job in self._jobs.values() if job.finished_at is not None]
+        if len(finished) > self.keep_finished:
+            finished.sort(key=lambda job: job.finished_at)
+            for job in finished[:len(finished) - self.keep_finished]:
+                del self._jobs[job.id]
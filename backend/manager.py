@@ -0,0 +1,299 @@
+"""Orchestration of many concurrent auctions from a small set of accounts.
+
+Transactions are sent by per-account workers: every signing account belongs to exactly
+one single-threaded executor, so its nonces are always allocated and sent in order
+while auctions of different accounts progress in parallel. Workers do not wait for
+receipts, a step completes when all of its transactions are mined with status 1 and its
+follow-up runs on the same worker then. A scheduler thread follows new blocks and hands
+every auction step to the worker of its account once the block window of the step opens:
+
+* ``bid`` before ``bidBlockNumber``, the bidder takes part once the bid is mined
+* ``reveal`` after ``bidBlockNumber``
+* ``claim`` after ``revealBlockNumber`` (the highest registered bid is claimed), then
+  ``verify`` of all registered bidders (``ZKPVerifyBatch`` + ``VerifyAll``)
+* ``withdraw`` of every losing bidder once the winner is verified, or after
+  ``winnerPaymentBlockNumber``
+"""
+import heapq
+import itertools
+import logging
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+import eth_account
+
+from backend.evm_wrapper import BlindAuction
+from backend.metrics import register_gauges, rpc_metrics
+from backend.transactions import PendingTransaction
+from backend.zkp import prepare_zkp_rounds
+
+logger = logging.getLogger(__name__)
+
+
+class TransactionReverted(RuntimeError):
+    """Transaction of a step was mined with status 0."""
+
+
+@dataclass
+class ManagedAuction:
+    auction: BlindAuction
+    auctioneer: eth_account.account.LocalAccount
+    k: int
+    # bidder address -> (account, bid, blinding) of the mined bids
+    bids: Dict[str, Tuple[eth_account.account.LocalAccount, int, int]] = field(default_factory=dict)
+    phase: str = "bid"
+    error: Optional[str] = None
+
+
+@dataclass(order=True)
+class _Task:
+    due_block: int
+    seq: int
+    name: str = field(compare=False)
+    address: str = field(compare=False)
+    account: eth_account.account.LocalAccount = field(compare=False)
+    fn: Callable = field(compare=False)
+    # called on the worker with the receipts of the transactions returned by ``fn``
+    on_mined: Optional[Callable] = field(compare=False, default=None)
+    future: Future = field(compare=False, default_factory=Future)
+
+
+GAUGE_HELP = {
+    "auction_manager_queue_depth": "Steps queued on every worker.",
+    "auction_manager_scheduled_steps": "Steps waiting for their block window.",
+    "auction_manager_lag_blocks": "Blocks between the due block of the dispatched steps and the head.",
+    "auction_manager_auctions": "Managed auctions per phase.",
+    "auction_manager_failed_auctions": "Auctions stopped by a failed step.",
+    "auction_manager_failed_steps": "Failed steps per step name.",
+}
+
+
+class AuctionManager:
+    """Runs the steps of many auctions in parallel on per-account workers."""
+
+    def __init__(self, rpc_address: str, contract_file: Path, workers: int = 4, poll_interval: float = 0.5,
+                 provider=None):
+        self.rpc_address = rpc_address
+        self.contract_file = contract_file
+        self.poll_interval = poll_interval
+        self.provider = provider
+        self._workers = [ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"auction-worker-{i}")
+                         for i in range(workers)]
+        self._queued = [0] * workers
+        self._shards: Dict[str, int] = {}
+        self._auctions: Dict[str, ManagedAuction] = {}
+        self._tasks: List[_Task] = []
+        self._seq = itertools.count()
+        self._lag: List[int] = []
+        self._failed_steps: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._clock = BlindAuction(rpc_address, contract_file, provider=provider).block_clock
+        register_gauges(self.gauges, GAUGE_HELP)
+
+    def _shard(self, account) -> int:
+        """Worker owning the account, accounts are assigned round-robin on first use."""
+        with self._lock:
+            shard = self._shards.get(account.address)
+            if shard is None:
+                shard = self._shards[account.address] = len(self._shards) % len(self._workers)
+            return shard
+
+    def add(self, address: str, auctioneer: eth_account.account.LocalAccount, k: int) -> ManagedAuction:
+        """Starts managing a deployed auction with ``k`` ZKP rounds.
+
+        Its claim is scheduled after ``revealBlockNumber``.
+        """
+        auction = BlindAuction(self.rpc_address, self.contract_file, provider=self.provider)
+        auction.contact_address = address
+        managed = ManagedAuction(auction, auctioneer, k)
+        with self._lock:
+            self._auctions[address] = managed
+        self._schedule("claim", address, auctioneer, auction.reveal_block_number, lambda: self._claim(managed),
+                       lambda receipts: self._claimed(managed))
+        return managed
+
+    def bid(self, address: str, account, x: int, r: int, value: int) -> Future:
+        """Sends the bid, the future resolves with its receipt once it is mined."""
+        managed = self._auctions[address]
+        cX, cY = managed.auction.pedersen.get_dot(x, r)
+
+        def register(receipts):
+            managed.bids[account.address] = (account, x, r)
+
+        return self._schedule("bid", address, account, 0,
+                              lambda: managed.auction.bid(cX, cY, value, account, wait=False), register)
+
+    def reveal(self, address: str, account, cipher: bytes) -> Future:
+        auction = self._auctions[address].auction
+        return self._schedule("reveal", address, account, auction.bid_block_number,
+                              lambda: auction.reveal(cipher, account, wait=False))
+
+    def _claim(self, managed: ManagedAuction):
+        if not managed.bids:
+            managed.phase = "no_bids"
+            return None
+        winner, x, r = max(managed.bids.values(), key=lambda bid: bid[1])
+        return managed.auction.claim_winner(winner.address, x, r, managed.auctioneer, wait=False)
+
+    def _claimed(self, managed: ManagedAuction):
+        managed.phase = "verify"
+        self._schedule("verify", managed.auction.contact_address, managed.auctioneer, 0,
+                       lambda: self._verify(managed), lambda receipts: self._verified(managed))
+
+    def _verify(self, managed: ManagedAuction) -> List[PendingTransaction]:
+        """Sends the proof batches and ``VerifyAll`` back-to-back, nonces keep them in order."""
+        auction = managed.auction
+        proofs = prepare_zkp_rounds(auction.pedersen,
+                                    [(address, x, r) for address, (_, x, r) in managed.bids.items()],
+                                    managed.k, auction.max_bid)
+        pending = auction.zkp_verify_batch([(proof.address, proof.commits, proof.response) for proof in proofs],
+                                           managed.auctioneer, wait=False)
+        return pending + [auction.verify_all(managed.auctioneer, wait=False)]
+
+    def _verified(self, managed: ManagedAuction):
+        managed.phase = "withdraw"
+        self._schedule_withdrawals(managed, 0, managed.auction.winner)
+
+    def _schedule_withdrawals(self, managed: ManagedAuction, due_block: int, winner: Optional[str] = None):
+        auction = managed.auction
+        for account, _, _ in managed.bids.values():
+            if account.address != winner:
+                self._schedule("withdraw", auction.contact_address, account, due_block,
+                               lambda account=account: auction.withdraw(account, wait=False))
+
+    def _schedule(self, name: str, address: str, account, due_block: int, fn: Callable,
+                  on_mined: Optional[Callable] = None) -> Future:
+        task = _Task(due_block, next(self._seq), name, address, account, fn, on_mined)
+        with self._lock:
+            heapq.heappush(self._tasks, task)
+        return task.future
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="auction-manager", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        for worker in self._workers:
+            worker.shutdown(wait=True)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self._dispatch_due(self._clock.current())
+            except Exception:
+                logger.exception("Auction manager iteration failed")
+            self._stop.wait(self.poll_interval)
+
+    def _dispatch_due(self, head: int):
+        """Hands over all tasks whose block window is open at ``head``.
+
+        A transaction sent at ``head`` is mined at ``head + 1`` at the earliest, so a step
+        that needs ``block.number > due_block`` can be sent once ``head >= due_block``.
+        """
+        with self._lock:
+            due = []
+            while self._tasks and self._tasks[0].due_block <= head:
+                due.append(heapq.heappop(self._tasks))
+            self._lag.extend(max(0, head - task.due_block) for task in due if task.due_block)
+            del self._lag[:-1000]
+        for task in due:
+            shard = self._shard(task.account)
+            with self._lock:
+                self._queued[shard] += 1
+            self._workers[shard].submit(self._execute, shard, task, time.monotonic())
+
+    def _execute(self, shard: int, task: _Task, queued_at: float):
+        with self._lock:
+            self._queued[shard] -= 1
+        rpc_metrics.record("stage", f"manager.{task.name}:queue", time.monotonic() - queued_at)
+        try:
+            with rpc_metrics.timed("stage", f"manager.{task.name}"):
+                result = task.fn()
+        except Exception as e:
+            self._fail(task, e)
+            return
+        if isinstance(result, PendingTransaction):
+            result = [result]
+        if not isinstance(result, list):  # nothing was sent
+            task.future.set_result(result)
+            return
+        remaining = [len(result)]
+        sent_at = time.monotonic()
+
+        def mined(_):
+            with self._lock:
+                remaining[0] -= 1
+                if remaining[0]:
+                    return
+            rpc_metrics.record("stage", f"manager.{task.name}:mined", time.monotonic() - sent_at)
+            self._workers[shard].submit(self._complete, task, result)
+
+        for pending in result:
+            pending.receipt_future.add_done_callback(mined)
+
+    def _complete(self, task: _Task, pending: List[PendingTransaction]):
+        """Runs on the worker once all transactions of the step are mined."""
+        try:
+            receipts = [transaction.receipt_future.result() for transaction in pending]
+            for receipt in receipts:
+                if receipt["status"] != 1:
+                    raise TransactionReverted(f"Transaction {receipt['transactionHash'].hex()} reverted")
+            if task.on_mined is not None:
+                task.on_mined(receipts)
+        except Exception as e:
+            self._fail(task, e)
+            return
+        task.future.set_result(receipts[0] if len(receipts) == 1 else receipts)
+
+    def _fail(self, task: _Task, error: Exception):
+        """A failed bid, reveal or withdraw only concerns its account, the auction goes on."""
+        managed = self._auctions[task.address]
+        logger.error("Step %s of auction %s failed", task.name, task.address, exc_info=error)
+        with self._lock:
+            self._failed_steps[task.name] = self._failed_steps.get(task.name, 0) + 1
+        task.future.set_exception(error)
+        if task.name in ("claim", "verify"):  # bidders get their fees back after the payment window
+            managed.error = f"{task.name}: {type(error).__name__}: {error}"
+            managed.phase = "withdraw"
+            self._schedule_withdrawals(managed, managed.auction.winner_payment_block_number)
+
+    def metrics(self) -> dict:
+        """Queue depth of every worker, scheduled steps, lag of the dispatched ones in blocks,
+        auctions per phase and failures."""
+        with self._lock:
+            lag = sorted(self._lag)
+            phases: Dict[str, int] = {}
+            for managed in self._auctions.values():
+                phases[managed.phase] = phases.get(managed.phase, 0) + 1
+            return {"queue_depth": list(self._queued),
+                    "scheduled": len(self._tasks),
+                    "next_due_block": self._tasks[0].due_block if self._tasks else None,
+                    "lag_blocks": {"p50": lag[len(lag) // 2], "max": lag[-1]} if lag else None,
+                    "auctions": phases,
+                    "failed": sum(managed.error is not None for managed in self._auctions.values()),
+                    "failed_steps": dict(self._failed_steps)}
+
+    def gauges(self) -> Dict[str, Dict[str, float]]:
+        """``metrics`` for the Prometheus export of ``backend.metrics``."""
+        metrics = self.metrics()
+        lag = metrics["lag_blocks"] or {}
+        return {"auction_manager_queue_depth": {f'worker="{i}"': depth
+                                                for i, depth in enumerate(metrics["queue_depth"])},
+                "auction_manager_scheduled_steps": {"": metrics["scheduled"]},
+                "auction_manager_lag_blocks": {'quantile="0.5"': lag.get("p50", 0),
+                                               'quantile="1"': lag.get("max", 0)},
+                "auction_manager_auctions": {f'phase="{phase}"': count
+                                             for phase, count in metrics["auctions"].items()},
+                "auction_manager_failed_auctions": {"": metrics["failed"]},
+                "auction_manager_failed_steps": {f'step="{step}"': count
+                                                 for step, count in metrics["failed_steps"].items()}}
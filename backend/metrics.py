@@ -0,0 +1,243 @@
+"""JSON-RPC and contract call instrumentation.
+
+``rpc_metrics_middleware`` is installed into the web3 instance of every contract wrapper
+and records call counts, latency histograms and payload sizes per JSON-RPC method.
+``eth_call``/``eth_estimateGas`` are also attributed to the contract function whose
+selector they carry. Wrappers record the stages of their transactions (nonce, signing,
+sending, waiting for the receipt) the same way. Other components export their state
+as gauges through ``register_gauges``. ``render_prometheus`` exports everything in the
+Prometheus text format. ``span`` wraps a block in an OpenTelemetry span when
+``opentelemetry`` is installed.
+"""
+import json
+import threading
+import time
+import weakref
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, List, Tuple
+
+try:
+    from opentelemetry import trace
+except ImportError:  # pragma: no cover
+    trace = None
+
+from eth_utils import function_abi_to_4byte_selector
+
+from backend.compiler import abi_hash
+from backend.fees import gas_stats
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+# function selector -> "Contract.function", filled by the contract wrappers
+_selectors: Dict[str, str] = {}
+# (contract name, ABI hash) pairs already in ``_selectors``
+_registered = set()
+
+
+def register_abi(contract_name: str, abi: list) -> None:
+    """Makes calls of the contract functions recognisable by their selector."""
+    key = (contract_name, abi_hash(abi))
+    if key in _registered:
+        return
+    _registered.add(key)
+    for function_abi in abi:
+        if function_abi["type"] == "function":
+            _selectors["0x" + function_abi_to_4byte_selector(function_abi).hex()] = \
+                f"{contract_name}.{function_abi['name']}"
+
+
+def function_of(params) -> str:
+    """Contract function called by ``eth_call``/``eth_estimateGas`` params."""
+    data = params[0].get("data") or params[0].get("input") or ""
+    if not isinstance(data, str):
+        data = "0x" + bytes(data).hex()
+    return _selectors.get(data[:10], "unknown")
+
+
+def payload_size(payload) -> int:
+    return len(json.dumps(payload, default=str))
+
+
+class _Series:
+    __slots__ = ("count", "errors", "total", "histogram", "request_bytes", "response_bytes")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.histogram = [0] * len(LATENCY_BUCKETS)
+        self.request_bytes = 0
+        self.response_bytes = 0
+
+
+class RpcMetrics:
+    """Thread-safe latency histograms keyed by ``(kind, name)``.
+
+    Kinds are ``rpc`` (JSON-RPC method), ``function`` (contract function called through
+    ``eth_call``/``eth_estimateGas``) and ``stage`` (``Contract.function:stage`` steps of
+    the wrapper transactions).
+    """
+
+    def __init__(self):
+        self._series: Dict[Tuple[str, str], _Series] = {}
+        self._lock = threading.Lock()
+
+    def record(self, kind: str, name: str, duration: float, request_bytes: int = 0, response_bytes: int = 0,
+               error: bool = False):
+        with self._lock:
+            series = self._series.get((kind, name))
+            if series is None:
+                series = self._series[kind, name] = _Series()
+            series.count += 1
+            series.errors += error
+            series.total += duration
+            series.histogram[next(i for i, bound in enumerate(LATENCY_BUCKETS) if duration <= bound)] += 1
+            series.request_bytes += request_bytes
+            series.response_bytes += response_bytes
+
+    @contextmanager
+    def timed(self, kind: str, name: str):
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.record(kind, name, time.perf_counter() - start, error=error)
+
+    def reset(self):
+        with self._lock:
+            self._series.clear()
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {f"{kind}:{name}": {"count": series.count, "errors": series.errors,
+                                       "mean": series.total / series.count,
+                                       "request_bytes": series.request_bytes,
+                                       "response_bytes": series.response_bytes}
+                    for (kind, name), series in self._series.items()}
+
+    def render_prometheus(self) -> str:
+        lines = ["# HELP auction_rpc_duration_seconds Latency of JSON-RPC requests, contract calls and "
+                 "transaction stages.",
+                 "# TYPE auction_rpc_duration_seconds histogram"]
+        sizes = ["# HELP auction_rpc_payload_bytes JSON-RPC request and response payload sizes.",
+                 "# TYPE auction_rpc_payload_bytes counter"]
+        errors = ["# HELP auction_rpc_errors_total Failed JSON-RPC requests, contract calls and "
+                  "transaction stages.",
+                  "# TYPE auction_rpc_errors_total counter"]
+        with self._lock:
+            for (kind, name), series in sorted(self._series.items()):
+                labels = f'kind="{kind}",name="{name}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, series.histogram):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'auction_rpc_duration_seconds_bucket{{{labels},le="{le}"}} {cumulative}')
+                lines.append(f"auction_rpc_duration_seconds_sum{{{labels}}} {series.total}")
+                lines.append(f"auction_rpc_duration_seconds_count{{{labels}}} {series.count}")
+                errors.append(f"auction_rpc_errors_total{{{labels}}} {series.errors}")
+                if kind == "rpc":
+                    sizes.append(f'auction_rpc_payload_bytes{{{labels},direction="request"}} {series.request_bytes}')
+                    sizes.append(f'auction_rpc_payload_bytes{{{labels},direction="response"}} '
+                                 f'{series.response_bytes}')
+        return "\n".join(lines + errors + sizes + _render_gas() + _render_gauges()) + "\n"
+
+
+def _render_gas() -> list:
+    lines = ["# HELP auction_gas_used Gas used by mined transactions per contract method.",
+             "# TYPE auction_gas_used histogram"]
+    for method, stats in sorted(gas_stats.summary().items()):
+        cumulative = 0
+        for bound, count in stats["histogram"].items():
+            cumulative += count
+            le = "+Inf" if bound == "inf" else bound
+            lines.append(f'auction_gas_used_bucket{{method="{method}",le="{le}"}} {cumulative}')
+        lines.append(f'auction_gas_used_sum{{method="{method}"}} {stats["mean"] * stats["count"]}')
+        lines.append(f'auction_gas_used_count{{method="{method}"}} {stats["count"]}')
+    return lines
+
+
+# gauge name -> help text, and the collectors returning ``{name: {labels: value}}``
+_gauge_help: Dict[str, str] = {}
+_gauge_collectors: List[Callable[[], Callable]] = []
+_gauge_lock = threading.Lock()
+
+
+def register_gauges(collect: Callable[[], Dict[str, Dict[str, float]]], help_texts: Dict[str, str]) -> None:
+    """Exports ``collect()`` as gauges in ``render_prometheus``.
+
+    ``collect`` returns ``{name: {labels: value}}`` with labels like ``'worker="0"'`` (empty
+    for none). A bound method is held weakly, its gauges disappear with the object.
+    """
+    ref = weakref.WeakMethod(collect) if hasattr(collect, "__self__") else (lambda: collect)
+    with _gauge_lock:
+        _gauge_help.update(help_texts)
+        _gauge_collectors.append(ref)
+
+
+def _render_gauges() -> list:
+    with _gauge_lock:
+        collectors = [ref() for ref in _gauge_collectors]
+        _gauge_collectors[:] = [ref for ref, collect in zip(_gauge_collectors, collectors) if collect is not None]
+    samples: Dict[str, List[str]] = {}
+    for collect in filter(None, collectors):
+        for name, values in collect().items():
+            samples.setdefault(name, []).extend(
+                f"{name}{{{labels}}} {value}" if labels else f"{name} {value}" for labels, value in values.items())
+    lines = []
+    for name in sorted(samples):
+        lines += [f"# HELP {name} {_gauge_help.get(name, name)}", f"# TYPE {name} gauge", *samples[name]]
+    return lines
+
+
+rpc_metrics = RpcMetrics()
+
+
+def span(name: str, **attributes):
+    """OpenTelemetry span if ``opentelemetry`` is installed, no-op context otherwise."""
+    if trace is None:
+        return nullcontext()
+    return trace.get_tracer(__name__).start_as_current_span(name, attributes=attributes)
+
+
+def rpc_metrics_middleware(make_request, web3_instance):
+    """web3 middleware recording every request into ``rpc_metrics``."""
+    def middleware(method, params):
+        function = function_of(params) if method in ("eth_call", "eth_estimateGas") else None
+        with span(f"rpc {method}", function=function or ""):
+            start = time.perf_counter()
+            response = None
+            try:
+                response = make_request(method, params)
+                return response
+            finally:
+                duration = time.perf_counter() - start
+                error = response is None or "error" in response
+                rpc_metrics.record("rpc", method, duration, payload_size(params),
+                                   payload_size(response) if response is not None else 0, error)
+                if function is not None:
+                    rpc_metrics.record("function", function, duration, error=error)
+    return middleware
+
+
+async def async_rpc_metrics_middleware(make_request, web3_instance):
+    """Asyncio counterpart of ``rpc_metrics_middleware`` for ``AsyncHTTPProvider``."""
+    async def middleware(method, params):
+        function = function_of(params) if method in ("eth_call", "eth_estimateGas") else None
+        with span(f"rpc {method}", function=function or ""):
+            start = time.perf_counter()
+            response = None
+            try:
+                response = await make_request(method, params)
+                return response
+            finally:
+                duration = time.perf_counter() - start
+                error = response is None or "error" in response
+                rpc_metrics.record("rpc", method, duration, payload_size(params),
+                                   payload_size(response) if response is not None else 0, error)
+                if function is not None:
+                    rpc_metrics.record("function", function, duration, error=error)
+    return middleware
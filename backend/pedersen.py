@@ -0,0 +1,292 @@
+"""Off-chain alt_bn128 arithmetic mirroring the ``Pedersen`` contract.
+
+The EVM precompiles used by the contract (``ecAdd`` at 0x06 and ``ecMul`` at 0x07)
+always operate on the alt_bn128 curve ``y^2 = x^3 + 3``, so commitments can be
+computed locally without any JSON-RPC round trip. ``gmpy2`` is used for the field
+arithmetic when it is installed.
+"""
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+
+try:
+    import gmpy2
+except ImportError:  # pragma: no cover
+    gmpy2 = None
+
+FIELD_MODULUS = 21888242871839275222246405745257275088696311157297823662689037894645226208583
+CURVE_ORDER = 21888242871839275222246405745257275088548364400416034343698204186575808495617
+CURVE_B = 3
+
+# Same values as the defaults of ``Pedersen.deploy`` and the contract itself.
+DEFAULT_PARAMETERS = {
+    "q": 21888242871839275222246405745257275088696311157297823662689037894645226208583,
+    "gX": 19823850254741169819033785099293761935467223354323761392354670518001715552183,
+    "gY": 15097907474011103550430959168661954736283086276546887690628027914974507414020,
+    "hX": 3184834430741071145030522771540763108892281233703148152311693391954704539228,
+    "hY": 1405615944858121891163559530323310827496899969303520166098610312148921359100,
+}
+
+if gmpy2 is not None:
+    _mpz = gmpy2.mpz
+
+    def _inverse(a):
+        return gmpy2.invert(a, _P)
+else:  # pragma: no cover
+    _mpz = int
+
+    def _inverse(a):
+        return pow(a, -1, _P)
+
+_P = _mpz(FIELD_MODULUS)
+# Jacobian point at infinity, the EVM encodes it as (0, 0) in affine form.
+_INFINITY = (_mpz(1), _mpz(1), _mpz(0))
+
+Point = Tuple[int, int]
+
+# Below this many commitments the work of the workers does not pay for sending it to them
+PARALLEL_MIN_ITEMS = 2048
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_size = 0
+_pool_lock = threading.Lock()
+
+
+def get_process_pool(processes: int) -> ProcessPoolExecutor:
+    """Returns process pool shared by all batch computations, rebuilt when ``processes`` changes.
+
+    Workers keep their engines (and precomputed tables) between calls.
+    """
+    global _pool, _pool_size
+    with _pool_lock:
+        if _pool is None or _pool_size != processes:
+            if _pool is not None:
+                _pool.shutdown(wait=False)
+            _pool, _pool_size = ProcessPoolExecutor(max_workers=processes), processes
+        return _pool
+
+
+def is_on_curve(x: int, y: int) -> bool:
+    """Checks point the same way as the precompiles do, (0, 0) is the point at infinity."""
+    if not (0 <= x < FIELD_MODULUS and 0 <= y < FIELD_MODULUS):
+        return False
+    if x == 0 and y == 0:
+        return True
+    return (y * y - x * x * x - CURVE_B) % FIELD_MODULUS == 0
+
+
+def _double(pt):
+    X, Y, Z = pt
+    if not Z or not Y:
+        return _INFINITY
+    A = X * X % _P
+    B = Y * Y % _P
+    C = B * B % _P
+    D = 2 * ((X + B) * (X + B) - A - C) % _P
+    E = 3 * A % _P
+    X3 = (E * E - 2 * D) % _P
+    Y3 = (E * (D - X3) - 8 * C) % _P
+    Z3 = 2 * Y * Z % _P
+    return X3, Y3, Z3
+
+
+def _add_affine(pt, x2, y2):
+    """Mixed addition of jacobian ``pt`` and affine (x2, y2)."""
+    X1, Y1, Z1 = pt
+    if not Z1:
+        return x2, y2, _mpz(1)
+    Z1Z1 = Z1 * Z1 % _P
+    U2 = x2 * Z1Z1 % _P
+    S2 = y2 * Z1 * Z1Z1 % _P
+    H = (U2 - X1) % _P
+    R = (S2 - Y1) % _P
+    if not H:
+        return _double(pt) if not R else _INFINITY
+    HH = H * H % _P
+    HHH = H * HH % _P
+    V = X1 * HH % _P
+    X3 = (R * R - HHH - 2 * V) % _P
+    Y3 = (R * (V - X3) - Y1 * HHH) % _P
+    Z3 = Z1 * H % _P
+    return X3, Y3, Z3
+
+
+def _add(p1, p2):
+    """Addition of two jacobian points."""
+    X1, Y1, Z1 = p1
+    X2, Y2, Z2 = p2
+    if not Z1:
+        return p2
+    if not Z2:
+        return p1
+    Z1Z1 = Z1 * Z1 % _P
+    Z2Z2 = Z2 * Z2 % _P
+    U1 = X1 * Z2Z2 % _P
+    U2 = X2 * Z1Z1 % _P
+    S1 = Y1 * Z2 * Z2Z2 % _P
+    S2 = Y2 * Z1 * Z1Z1 % _P
+    H = (U2 - U1) % _P
+    R = (S2 - S1) % _P
+    if not H:
+        return _double(p1) if not R else _INFINITY
+    HH = H * H % _P
+    HHH = H * HH % _P
+    V = U1 * HH % _P
+    X3 = (R * R - HHH - 2 * V) % _P
+    Y3 = (R * (V - X3) - S1 * HHH) % _P
+    Z3 = Z1 * Z2 * H % _P
+    return X3, Y3, Z3
+
+
+def _to_affine(pt) -> Point:
+    X, Y, Z = pt
+    if not Z:
+        return 0, 0
+    z_inv = _inverse(Z)
+    z_inv2 = z_inv * z_inv % _P
+    return int(X * z_inv2 % _P), int(Y * z_inv2 * z_inv % _P)
+
+
+def _to_affine_many(points) -> List[Point]:
+    """Normalizes many jacobian points with a single field inversion (Montgomery's trick)."""
+    prefix = []
+    acc = _mpz(1)
+    for X, Y, Z in points:
+        prefix.append(acc)
+        if Z:
+            acc = acc * Z % _P
+    acc_inv = _inverse(acc) if acc != 1 else _mpz(1)
+    result = [None] * len(points)
+    for i in range(len(points) - 1, -1, -1):
+        X, Y, Z = points[i]
+        if not Z:
+            result[i] = (0, 0)
+            continue
+        z_inv = acc_inv * prefix[i] % _P
+        acc_inv = acc_inv * Z % _P
+        z_inv2 = z_inv * z_inv % _P
+        result[i] = (int(X * z_inv2 % _P), int(Y * z_inv2 * z_inv % _P))
+    return result
+
+
+def _mul(scalar: int, x: int, y: int):
+    """Variable base double-and-add, returns jacobian point."""
+    scalar %= CURVE_ORDER
+    if not scalar or (x == 0 and y == 0):
+        return _INFINITY
+    x, y = _mpz(x), _mpz(y)
+    acc = _INFINITY
+    for bit in bin(scalar)[2:]:
+        acc = _double(acc)
+        if bit == "1":
+            acc = _add_affine(acc, x, y)
+    return acc
+
+
+class FixedBaseTable:
+    """Precomputed ``d * 2^(window * i) * P`` multiples of a fixed point."""
+
+    def __init__(self, x: int, y: int, window: int = 8):
+        self.window = window
+        self.mask = (1 << window) - 1
+        windows = -(-CURVE_ORDER.bit_length() // window)
+        jacobian = []
+        base = (_mpz(x), _mpz(y), _mpz(1))
+        for _ in range(windows):
+            acc = base
+            jacobian.append(acc)
+            for _ in range(self.mask - 1):
+                acc = _add(acc, base)
+                jacobian.append(acc)
+            base = _add(acc, base)
+        affine = [(_mpz(px), _mpz(py)) for px, py in _to_affine_many(jacobian)]
+        self.rows = [[None] + affine[i * self.mask:(i + 1) * self.mask] for i in range(windows)]
+
+    def mul(self, scalar: int, acc=_INFINITY):
+        """Adds ``scalar * P`` to jacobian ``acc``."""
+        scalar %= CURVE_ORDER
+        window, mask = self.window, self.mask
+        for row in self.rows:
+            if not scalar:
+                break
+            digit = scalar & mask
+            if digit:
+                acc = _add_affine(acc, *row[digit])
+            scalar >>= window
+        return acc
+
+
+class PedersenEngine:
+    """Computes ``Commit(b, r) = b*G + r*H`` locally, mirroring the ``Pedersen`` contract.
+
+    Scalars are reduced modulo the curve order, the same as the ``ecMul`` precompile does,
+    so negative values are handled as their field inverse.
+    """
+
+    def __init__(self, q: int, gX: int, gY: int, hX: int, hY: int, window: int = 8):
+        for x, y in ((gX, gY), (hX, hY)):
+            if not is_on_curve(x, y) or (x == 0 and y == 0):
+                raise ValueError(f"Point ({x}, {y}) is not a valid alt_bn128 generator")
+        self.parameters = {"q": q, "gX": gX, "gY": gY, "hX": hX, "hY": hY}
+        self.q = q
+        self.g = (gX, gY)
+        self.h = (hX, hY)
+        self._g_table = FixedBaseTable(gX, gY, window)
+        self._h_table = FixedBaseTable(hX, hY, window)
+
+    def _commit_jacobian(self, b: int, r: int):
+        return self._h_table.mul(r, self._g_table.mul(b))
+
+    def commit(self, b: int, r: int) -> Point:
+        return _to_affine(self._commit_jacobian(b, r))
+
+    def commit_many(self, values: Sequence[int], blindings: Sequence[int],
+                    processes: int = 0, chunk_size: int = 512) -> List[Point]:
+        """Computes ``Commit(values[i], blindings[i])`` for all i.
+
+        All points share the precomputed tables and are normalized with a single inversion.
+        With ``processes`` > 1 and at least ``PARALLEL_MIN_ITEMS`` values, chunks are spread
+        across the shared process pool.
+        """
+        if len(values) != len(blindings):
+            raise ValueError("values and blindings must have the same length")
+        if processes > 1 and len(values) >= max(PARALLEL_MIN_ITEMS, 2 * chunk_size):
+            chunks = [(self.parameters, values[i:i + chunk_size], blindings[i:i + chunk_size])
+                      for i in range(0, len(values), chunk_size)]
+            pool = get_process_pool(processes)
+            return [dot for part in pool.map(_commit_chunk, chunks) for dot in part]
+        return _to_affine_many([self._commit_jacobian(b, r) for b, r in zip(values, blindings)])
+
+    def verify(self, b: int, r: int, cX: int, cY: int) -> bool:
+        return self.commit(b, r) == (cX, cY)
+
+    def commit_delta(self, cX1: int, cY1: int, cX2: int, cY2: int) -> Point:
+        return self.ec_add(cX1, cY1, cX2, self.q - cY2)
+
+    @staticmethod
+    def ec_add(cX1: int, cY1: int, cX2: int, cY2: int) -> Point:
+        if not is_on_curve(cX1, cY1) or not is_on_curve(cX2, cY2):
+            raise ValueError("ecAdd input point is not on curve")
+        if cX1 == 0 and cY1 == 0:
+            return cX2, cY2
+        if cX2 == 0 and cY2 == 0:
+            return cX1, cY1
+        return _to_affine(_add_affine((_mpz(cX1), _mpz(cY1), _mpz(1)), _mpz(cX2), _mpz(cY2)))
+
+    @staticmethod
+    def ec_mul(b: int, cX1: int, cY1: int) -> Point:
+        if not is_on_curve(cX1, cY1):
+            raise ValueError("ecMul input point is not on curve")
+        return _to_affine(_mul(b, cX1, cY1))
+
+
+@lru_cache(maxsize=8)
+def get_engine(q: int, gX: int, gY: int, hX: int, hY: int) -> PedersenEngine:
+    """Returns process-wide engine for the given parameters, tables are built once."""
+    return PedersenEngine(q, gX, gY, hX, hY)
+
+
+def _commit_chunk(args) -> List[Point]:
+    parameters, values, blindings = args
+    return get_engine(**parameters).commit_many(values, blindings)
@@ -0,0 +1,266 @@
+"""HTTP provider pool shared by all wrappers of a process.
+
+``rpc_address`` may list several endpoints of the same chain separated by commas. Every
+endpoint keeps one keep-alive ``requests`` session with a bounded connection pool.
+State reads (``eth_call``, gas estimates, balances, logs) go to a healthy endpoint chosen
+with probability inversely proportional to its average latency. Block heights of the
+endpoints are compared every ``lag_interval`` seconds, endpoints more than ``max_lag``
+blocks behind the highest one get no state reads until they catch up, so a check that
+precedes a transaction does not see an older state than the node it is sent to.
+Everything else (transactions, nonces, filters, blocks and receipts) sticks to one
+endpoint until it fails, and so do reads pinned to a block number, which a lagging node
+may not have yet. Requests that time out or cannot connect are retried on the other
+endpoints, or on the same one after a pause if all of them failed. A failed endpoint is probed with ``eth_blockNumber``
+before it is used again.
+
+A timed out ``eth_sendRawTransaction`` may have been accepted by the node anyway. It is
+sent again, and a resend that the node rejects because it already knows the transaction
+(or because its nonce is used by that very transaction) counts as success.
+"""
+import json
+import logging
+import random
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+from eth_utils import keccak
+from hexbytes import HexBytes
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+from web3.providers.base import JSONBaseProvider
+from web3.types import RPCEndpoint, RPCResponse
+
+from backend.transactions import KNOWN_TRANSACTION_ERRORS
+
+logger = logging.getLogger(__name__)
+
+# Methods that may go to any endpoint, the others go to the sticky one
+BALANCED_METHODS = {"eth_call", "eth_estimateGas", "eth_getBalance", "eth_getCode", "eth_getStorageAt",
+                    "eth_getLogs", "eth_chainId", "net_version", "web3_clientVersion", "eth_gasPrice",
+                    "eth_maxPriorityFeePerGas", "eth_feeHistory"}
+# position of the block parameter of the balanced methods that take one
+BLOCK_PARAMETER = {"eth_call": 1, "eth_estimateGas": 1, "eth_getBalance": 1, "eth_getCode": 1, "eth_getStorageAt": 2}
+# "pending" is not among them, the pending block of another node lacks our transactions
+BLOCK_TAGS = {"latest", "earliest", "safe", "finalized"}
+# requests that must not be repeated blindly after the node may have processed them
+WRITE_METHODS = {"eth_sendRawTransaction", "eth_sendTransaction"}
+
+TRANSPORT_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+def is_sticky(method: str, params) -> bool:
+    """Whether the request has to go to the sticky endpoint."""
+    if method not in BALANCED_METHODS:
+        return True
+    position = BLOCK_PARAMETER.get(method)
+    return position is not None and len(params) > position and params[position] not in BLOCK_TAGS
+
+
+def is_not_sent(error: Exception) -> bool:
+    """Whether the request surely did not reach the node (connection was never established)."""
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    cause = error.args[0] if error.args else None
+    return isinstance(getattr(cause, "reason", cause), NewConnectionError)
+
+
+class EndpointError(IOError):
+    """No endpoint of the pool answered the request."""
+
+
+class Endpoint:
+    """One node of the pool, its session and latency statistics."""
+
+    def __init__(self, url: str, pool_size: int = 16, timeout: float = 10):
+        self.url = url
+        self.timeout = timeout
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.latency: Optional[float] = None  # moving average, seconds
+        self.healthy = True
+        self.failures = 0
+        self.failed_at = 0.0
+        self.block_number: Optional[int] = None  # at the last lag check
+
+    def post(self, data: bytes) -> bytes:
+        start = time.perf_counter()
+        response = self.session.post(self.url, data=data, headers={"Content-Type": "application/json"},
+                                     timeout=self.timeout)
+        if response.status_code >= 500:
+            raise requests.ConnectionError(f"{self.url} returned HTTP {response.status_code}")
+        response.raise_for_status()
+        duration = time.perf_counter() - start
+        self.latency = duration if self.latency is None else 0.8 * self.latency + 0.2 * duration
+        return response.content
+
+
+class PooledProvider(JSONBaseProvider):
+    """web3 provider balancing requests over the endpoints of one chain."""
+
+    def __init__(self, urls: List[str], pool_size: int = 16, timeout: float = 10, retries: int = 2,
+                 health_interval: float = 5.0, backoff: float = 0.5, max_lag: int = 0,
+                 lag_interval: float = 1.0):
+        super().__init__()
+        self.backoff = backoff
+        self.endpoints = [Endpoint(url, pool_size, timeout) for url in urls]
+        self.retries = retries
+        self.health_interval = health_interval
+        self.max_lag = max_lag
+        self.lag_interval = lag_interval
+        self._lag_checked = 0.0
+        self._sticky: Optional[Endpoint] = None
+        self._lock = threading.Lock()
+        self._lag_lock = threading.Lock()
+
+    @property
+    def endpoint_uri(self) -> str:
+        return self.endpoints[0].url
+
+    def __str__(self):
+        return f"Pooled RPC connection {','.join(endpoint.url for endpoint in self.endpoints)}"
+
+    def _available(self) -> List[Endpoint]:
+        """Healthy endpoints, failed ones are probed again after ``health_interval``."""
+        now = time.monotonic()
+        for endpoint in self.endpoints:
+            if not endpoint.healthy and now - endpoint.failed_at > self.health_interval:
+                self._probe(endpoint)
+        return [endpoint for endpoint in self.endpoints if endpoint.healthy]
+
+    def _probe(self, endpoint: Endpoint):
+        endpoint.failed_at = time.monotonic()
+        try:
+            endpoint.post(self.encode_rpc_request(RPCEndpoint("eth_blockNumber"), []))
+        except (*TRANSPORT_ERRORS, requests.HTTPError):
+            return
+        logger.info("RPC endpoint %s is back", endpoint.url)
+        endpoint.healthy = True
+        endpoint.failures = 0
+
+    def _in_sync(self, endpoints: List[Endpoint]) -> List[Endpoint]:
+        """Endpoints at most ``max_lag`` blocks behind the highest one, heights are read every
+        ``lag_interval`` seconds by one of the requesting threads."""
+        if len(endpoints) < 2:
+            return endpoints
+        if time.monotonic() - self._lag_checked > self.lag_interval and self._lag_lock.acquire(blocking=False):
+            try:
+                self._lag_checked = time.monotonic()
+                request = self.encode_rpc_request(RPCEndpoint("eth_blockNumber"), [])
+                for endpoint in endpoints:
+                    try:
+                        endpoint.block_number = int(json.loads(endpoint.post(request))["result"], 16)
+                    except (*TRANSPORT_ERRORS, requests.HTTPError) as e:
+                        self._mark_failed(endpoint, e)
+                    except (KeyError, TypeError, ValueError):  # error response
+                        endpoint.block_number = None
+            finally:
+                self._lag_lock.release()
+        heights = [endpoint.block_number for endpoint in endpoints if endpoint.block_number is not None]
+        if not heights:
+            return endpoints
+        head = max(heights)
+        in_sync = [endpoint for endpoint in endpoints
+                   if endpoint.healthy and endpoint.block_number is not None
+                   and head - endpoint.block_number <= self.max_lag]
+        return in_sync or endpoints
+
+    def _mark_failed(self, endpoint: Endpoint, error: Exception):
+        logger.warning("RPC endpoint %s failed: %s", endpoint.url, error)
+        with self._lock:
+            endpoint.healthy = False
+            endpoint.failures += 1
+            endpoint.failed_at = time.monotonic()
+            if self._sticky is endpoint:
+                self._sticky = None
+
+    def _choose(self, sticky: bool, exclude: List[Endpoint]) -> Endpoint:
+        available = self._available()
+        in_sync = self._in_sync(available)
+        with self._lock:
+            candidates = [endpoint for endpoint in available if endpoint not in exclude]
+            if not candidates:  # every endpoint failed recently, retry the one that failed first
+                candidates = sorted(self.endpoints, key=lambda endpoint: endpoint.failed_at)[:1]
+            if sticky:
+                if self._sticky not in candidates:
+                    self._sticky = next((endpoint for endpoint in candidates if endpoint in in_sync), candidates[0])
+                    logger.info("Sticky RPC endpoint is %s", self._sticky.url)
+                return self._sticky
+            candidates = [endpoint for endpoint in candidates if endpoint in in_sync] or candidates
+            unmeasured = [endpoint for endpoint in candidates if endpoint.latency is None]
+            if unmeasured:
+                return unmeasured[0]
+            return random.choices(candidates, weights=[1 / max(endpoint.latency, 1e-4)
+                                                       for endpoint in candidates])[0]
+
+    def post(self, data: bytes, calls: List[Tuple[str, list]]) -> bytes:
+        """Sends raw JSON-RPC payload of ``(method, params)`` calls (one or a batch), failing
+        over to other endpoints on transport errors."""
+        sticky = any(is_sticky(method, params) for method, params in calls)
+        write = any(method in WRITE_METHODS for method, _ in calls)
+        maybe_sent = False
+        tried: List[Endpoint] = []
+        while True:
+            endpoint = self._choose(sticky, tried)
+            try:
+                raw_response = endpoint.post(data)
+                break
+            except TRANSPORT_ERRORS as e:
+                self._mark_failed(endpoint, e)
+                maybe_sent = maybe_sent or (write and not is_not_sent(e))
+                tried.append(endpoint)
+                if len(tried) > self.retries:
+                    raise EndpointError(f"RPC request failed {len(tried)} times: {self}") from e
+                if set(self.endpoints) <= set(tried):  # give a restarting node some time
+                    time.sleep(self.backoff * len(tried))
+        return self._recover_writes(calls, raw_response) if maybe_sent else raw_response
+
+    def _recover_writes(self, calls: List[Tuple[str, list]], raw_response: bytes) -> bytes:
+        """Turns rejections of transactions that the timed out attempt delivered into results."""
+        responses = json.loads(raw_response)
+        for i, response in enumerate(responses if isinstance(responses, list) else [responses]):
+            method, params = calls[response.get("id", i)] if isinstance(responses, list) else calls[0]
+            if method != "eth_sendRawTransaction" or "error" not in response:
+                continue
+            tx_hash = "0x" + keccak(HexBytes(params[0])).hex()
+            message = str(response["error"].get("message", "")).lower()
+            if any(error in message for error in KNOWN_TRANSACTION_ERRORS) or self._is_known(tx_hash):
+                logger.info("Transaction %s was delivered before the timeout", tx_hash)
+                response.pop("error")
+                response["result"] = tx_hash
+        return json.dumps(responses).encode()
+
+    def _is_known(self, tx_hash: str) -> bool:
+        try:
+            return self.make_request(RPCEndpoint("eth_getTransactionByHash"), [tx_hash]).get("result") is not None
+        except (EndpointError, ValueError):
+            return False
+
+    def make_request(self, method: RPCEndpoint, params) -> RPCResponse:
+        return self.decode_rpc_response(self.post(self.encode_rpc_request(method, params), [(method, params)]))
+
+    def is_connected(self) -> bool:
+        try:
+            self.make_request(RPCEndpoint("web3_clientVersion"), [])
+        except (EndpointError, requests.HTTPError, ValueError):
+            return False
+        return True
+
+    def status(self) -> list:
+        return [{"url": endpoint.url, "healthy": endpoint.healthy, "failures": endpoint.failures,
+                 "latency": endpoint.latency, "block_number": endpoint.block_number} for endpoint in self.endpoints]
+
+
+_providers: Dict[str, PooledProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(rpc_address: str) -> PooledProvider:
+    """Returns provider shared by all wrappers of ``rpc_address`` (comma separated URLs)."""
+    with _providers_lock:
+        if rpc_address not in _providers:
+            _providers[rpc_address] = PooledProvider([url.strip() for url in rpc_address.split(",") if url.strip()])
+        return _providers[rpc_address]
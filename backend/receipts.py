@@ -0,0 +1,202 @@
+"""Shared receipt waiter driven by new blocks instead of per-transaction polling.
+
+One background thread per node watches new block headers (``eth_newBlockFilter``
+when the node supports it, ``eth_blockNumber`` polling otherwise). It matches the
+transactions of every new block against all pending hashes in one pass. Receipts are
+fetched only for transactions that are known to be mined.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, List, Optional
+
+import web3
+from hexbytes import HexBytes
+from web3._utils.method_formatters import receipt_formatter
+from web3.datastructures import AttributeDict
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+from backend.rpc import batch_request
+
+logger = logging.getLogger(__name__)
+
+
+class _Watch:
+    __slots__ = ("future", "deadline", "confirmations", "block_number")
+
+    def __init__(self, future: Future, deadline: float, confirmations: int):
+        self.future = future
+        self.deadline = deadline
+        self.confirmations = confirmations
+        self.block_number: Optional[int] = None
+
+
+class ReceiptWaiter:
+    """Resolves receipt futures of all pending transactions of one node.
+
+    ``confirmations`` is the number of blocks that must be built on top of the block of
+    the transaction before its future resolves.
+    """
+
+    def __init__(self, web3_instance: web3.Web3, confirmations: int = 0, poll_interval: float = 0.1,
+                 use_filter: bool = True, max_catch_up: int = 64):
+        self.web3 = web3_instance
+        self.confirmations = confirmations
+        self.poll_interval = poll_interval
+        self.use_filter = use_filter
+        self.max_catch_up = max_catch_up
+        self.head: Optional[int] = None
+        self._watches: Dict[HexBytes, List[_Watch]] = {}
+        # block number -> transaction hashes of recently processed blocks
+        self._recent_blocks: "OrderedDict[int, set]" = OrderedDict()
+        self._filter = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._stopped = False
+        self._thread: Optional[threading.Thread] = None
+
+    def watch(self, tx_hash, timeout: float = 120, confirmations: Optional[int] = None) -> Future:
+        """Returns future resolved with the receipt of ``tx_hash``."""
+        tx_hash = HexBytes(tx_hash)
+        watch = _Watch(Future(), time.monotonic() + timeout,
+                       self.confirmations if confirmations is None else confirmations)
+        with self._lock:
+            for block_number, tx_hashes in self._recent_blocks.items():
+                if tx_hash in tx_hashes:  # mined before the watch was registered
+                    watch.block_number = block_number
+            self._watches.setdefault(tx_hash, []).append(watch)
+            self._ensure_running()
+            self._wakeup.notify()
+        return watch.future
+
+    def wait(self, tx_hash, timeout: float = 120, confirmations: Optional[int] = None):
+        return self.watch(tx_hash, timeout, confirmations).result()
+
+    def stop(self):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _ensure_running(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name="receipt-waiter", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._watches and not self._stopped:
+                    self._wakeup.wait()
+                if self._stopped:
+                    return
+            try:
+                self._process_new_blocks()
+                self._resolve()
+            except Exception:
+                logger.exception("Receipt waiter iteration failed")
+            time.sleep(self.poll_interval)
+
+    def _new_block_ids(self) -> list:
+        if self.use_filter:
+            try:
+                if self._filter is not None:
+                    return self._filter.get_new_entries()
+                self._filter = self.web3.eth.filter("latest")
+            except ValueError:
+                if self._filter is None:
+                    logger.info("Block filter is unavailable, falling back to eth_blockNumber polling")
+                    self.use_filter = False
+                self._filter = None  # expired filter is recreated on the next iteration
+        # Polling, also catches up blocks mined before the filter was (re)created
+        head = self.web3.eth.block_number
+        if self.head is None or head - self.head > self.max_catch_up:
+            self._lookup_pending_directly()
+            self.head = head
+            return []
+        return list(range(self.head + 1, head + 1))
+
+    def _process_new_blocks(self):
+        for block_id in self._new_block_ids():
+            block = self.web3.eth.get_block(block_id)
+            tx_hashes = set(block["transactions"])
+            with self._lock:
+                self.head = max(self.head or 0, block["number"])
+                self._recent_blocks[block["number"]] = tx_hashes
+                while len(self._recent_blocks) > self.max_catch_up:
+                    self._recent_blocks.popitem(last=False)
+                for tx_hash in tx_hashes & self._watches.keys():
+                    for watch in self._watches[tx_hash]:
+                        watch.block_number = block["number"]
+
+    def _lookup_pending_directly(self):
+        """Used after a gap longer than ``max_catch_up`` blocks instead of scanning it."""
+        with self._lock:
+            tx_hashes = list(self._watches)
+        for tx_hash in tx_hashes:
+            try:
+                receipt = self.web3.eth.get_transaction_receipt(tx_hash)
+            except TransactionNotFound:
+                continue
+            with self._lock:
+                for watch in self._watches.get(tx_hash, []):
+                    watch.block_number = receipt["blockNumber"]
+
+    def _get_receipts(self, tx_hashes: List[HexBytes]) -> list:
+        """Fetches receipts of all transactions in one JSON-RPC batch."""
+        receipts = []
+        for response in batch_request(self.web3, [("eth_getTransactionReceipt", [tx_hash.hex()])
+                                                  for tx_hash in tx_hashes]):
+            result = response.get("result")
+            receipts.append(AttributeDict.recursive(receipt_formatter(result)) if result else None)
+        return receipts
+
+    def _resolve(self):
+        now = time.monotonic()
+        with self._lock:
+            ready = [tx_hash for tx_hash, watches in self._watches.items()
+                     if self.head is not None
+                     and any(w.block_number is not None and self.head - w.block_number >= w.confirmations
+                             for w in watches)]
+            expired = [(tx_hash, w) for tx_hash, watches in self._watches.items()
+                       for w in watches if w.deadline < now]
+        for tx_hash, receipt in zip(ready, self._get_receipts(ready)):
+            # receipt is None if the transaction was dropped by a reorg, wait for it to be mined again
+            with self._lock:
+                remaining = []
+                for watch in self._watches.pop(tx_hash, []):
+                    if receipt is None:
+                        watch.block_number = None
+                        remaining.append(watch)
+                    elif self.head - receipt["blockNumber"] >= watch.confirmations:
+                        watch.future.set_result(receipt)
+                    else:
+                        watch.block_number = receipt["blockNumber"]
+                        remaining.append(watch)
+                if remaining:
+                    self._watches[tx_hash] = remaining
+        for tx_hash, watch in expired:
+            with self._lock:
+                watches = self._watches.get(tx_hash, [])
+                if watch in watches:
+                    watches.remove(watch)
+                    if not watches:
+                        del self._watches[tx_hash]
+                    watch.future.set_exception(TimeExhausted(
+                        f"Transaction {tx_hash.hex()} is not in the chain after timeout"))
+
+
+_waiters: Dict[str, ReceiptWaiter] = {}
+_waiters_lock = threading.Lock()
+
+
+def get_receipt_waiter(rpc_address: str, web3_instance: web3.Web3) -> ReceiptWaiter:
+    """Returns receipt waiter shared by all wrappers connected to the same node."""
+    with _waiters_lock:
+        if rpc_address not in _waiters:
+            _waiters[rpc_address] = ReceiptWaiter(web3_instance)
+        return _waiters[rpc_address]
@@ -0,0 +1,37 @@
+"""Raw JSON-RPC helpers that web3 does not provide."""
+import json
+import time
+from typing import List, Tuple
+
+import web3
+from web3._utils.request import make_post_request
+
+from backend.metrics import rpc_metrics, span
+from backend.providers import PooledProvider
+
+
+def batch_request(web3_instance: web3.Web3, calls: List[Tuple[str, list]]) -> List[dict]:
+    """Sends ``(method, params)`` calls as one JSON-RPC batch.
+
+    Returns raw responses in the order of ``calls``, each one holds either ``result`` or
+    ``error``. Providers without HTTP transport fall back to sequential requests.
+    """
+    if not calls:
+        return []
+    provider = web3_instance.provider
+    if not isinstance(provider, (web3.HTTPProvider, PooledProvider)):
+        return [provider.make_request(method, params) for method, params in calls]
+    payload = [{"jsonrpc": "2.0", "method": method, "params": params, "id": i}
+               for i, (method, params) in enumerate(calls)]
+    data = json.dumps(payload).encode()
+    with span("rpc batch", size=len(calls)):
+        start = time.perf_counter()
+        if isinstance(provider, PooledProvider):
+            raw_response = provider.post(data, calls)
+        else:
+            raw_response = make_post_request(provider.endpoint_uri, data, **provider.get_request_kwargs())
+        rpc_metrics.record("rpc", "batch", time.perf_counter() - start, len(data), len(raw_response))
+    responses = json.loads(raw_response)
+    if isinstance(responses, dict):  # node rejected the whole batch
+        raise ValueError(responses.get("error", responses))
+    return sorted(responses, key=lambda response: response["id"])
@@ -0,0 +1,162 @@
+"""Fast transaction encoding and signing for the contract wrappers.
+
+``CallEncoder`` keeps the selector and a prebuilt ``eth_abi`` encoder of every contract
+function, so calldata is encoded without ABI lookups. Transactions are serialized
+with ``rlp`` and signed with an ``eth_keys`` key object cached per account. The key uses
+``coincurve`` (libsecp256k1) when it is installed. The output is byte-for-byte the same
+as ``Account.sign_transaction`` for legacy and EIP-1559 transactions.
+"""
+import json
+import os
+import threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+import eth_account
+import rlp
+from eth_abi.encoding import TupleEncoder
+from eth_abi.exceptions import EncodingError
+from eth_abi.registry import registry
+from eth_account import Account
+from eth_keys import KeyAPI
+from eth_utils import function_abi_to_4byte_selector, keccak, to_bytes, to_checksum_address
+from hexbytes import HexBytes
+
+from backend.compiler import abi_hash
+
+try:
+    import coincurve  # noqa: F401
+    _keys = KeyAPI("eth_keys.backends.CoinCurveECCBackend")
+except ImportError:  # pragma: no cover
+    _keys = KeyAPI()
+
+_DYNAMIC_FEE_TYPE = b"\x02"
+
+
+def _abi_type(component: dict) -> str:
+    """Canonical type string, tuples are expanded to ``(t1,t2,...)``."""
+    if component["type"].startswith("tuple"):
+        return f"({','.join(_abi_type(c) for c in component['components'])}){component['type'][5:]}"
+    return component["type"]
+
+
+class CallEncoder:
+    """Calldata encoder of the functions of one contract ABI."""
+
+    def __init__(self, abi: list):
+        self._functions: Dict[Tuple[str, int], Tuple[bytes, TupleEncoder]] = {}
+        for function_abi in abi:
+            if function_abi["type"] != "function":
+                continue
+            encoder = TupleEncoder(encoders=[registry.get_encoder(_abi_type(i)) for i in function_abi["inputs"]])
+            self._functions[function_abi["name"], len(function_abi["inputs"])] = (
+                function_abi_to_4byte_selector(function_abi), encoder)
+
+    def encode(self, fn_name: str, args: tuple) -> bytes:
+        selector, encoder = self._functions[fn_name, len(args)]
+        return selector + encoder(args)
+
+    def encode_function(self, function) -> bytes:
+        """Calldata of a bound ``ContractFunction`` or ``ContractConstructor``.
+
+        Arguments that need web3's normalizers (hex strings for ``bytes``, ENS names)
+        are encoded by web3 itself.
+        """
+        if not hasattr(function, "fn_name"):  # constructor, bytecode + arguments
+            return to_bytes(hexstr=function.data_in_transaction)
+        if not function.kwargs:
+            try:
+                return self.encode(function.fn_name, function.args)
+            except EncodingError:
+                pass
+        return to_bytes(hexstr=function._encode_transaction_data())
+
+
+_encoders: Dict[Tuple[str, str], CallEncoder] = {}
+_encoders_lock = threading.Lock()
+
+
+def get_call_encoder(contract_name: str, abi: list) -> CallEncoder:
+    """Returns encoder shared by all wrappers of the same contract and ABI."""
+    key = (contract_name, abi_hash(abi))
+    with _encoders_lock:
+        if key not in _encoders:
+            _encoders[key] = CallEncoder(abi)
+        return _encoders[key]
+
+
+class SignerRegistry:
+    """Accounts the server signs with, selected by address.
+
+    Keys never come from requests. They are loaded at startup from ``SIGNER_KEYS_FILE``
+    (one private key per line) and from the encrypted JSON keystores in ``SIGNER_KEYSTORE``
+    (decrypted with ``SIGNER_KEYSTORE_PASSWORD``).
+    """
+
+    def __init__(self, accounts: List[eth_account.account.LocalAccount] = ()):
+        self._accounts = {account.address: account for account in accounts}
+
+    @classmethod
+    def from_environment(cls, environ=os.environ) -> "SignerRegistry":
+        accounts = []
+        keys_file = environ.get("SIGNER_KEYS_FILE")
+        if keys_file:
+            accounts += [Account.from_key(key) for key in Path(keys_file).read_text().split()]
+        keystore = environ.get("SIGNER_KEYSTORE")
+        if keystore:
+            password = environ.get("SIGNER_KEYSTORE_PASSWORD", "")
+            accounts += [Account.from_key(Account.decrypt(json.loads(path.read_text()), password))
+                         for path in sorted(Path(keystore).iterdir()) if path.is_file()]
+        return cls(accounts)
+
+    @property
+    def addresses(self) -> List[str]:
+        return list(self._accounts)
+
+    def get(self, address: str) -> eth_account.account.LocalAccount:
+        """Raises ``KeyError`` if no key of ``address`` is configured."""
+        return self._accounts[to_checksum_address(address)]
+
+
+@lru_cache(maxsize=1024)
+def _signing_key(private_key: bytes):
+    return _keys.PrivateKey(private_key)
+
+
+def get_signing_key(account: eth_account.account.LocalAccount):
+    """``eth_keys`` private key of the account, built once per key."""
+    return _signing_key(bytes(account.key))
+
+
+def _to(transaction: dict) -> bytes:
+    to = transaction.get("to")
+    return to_bytes(hexstr=to) if to else b""
+
+
+def _data(transaction: dict) -> bytes:
+    data = transaction.get("data", b"")
+    return to_bytes(hexstr=data) if isinstance(data, str) else bytes(data)
+
+
+def sign_transaction(transaction: dict, key) -> HexBytes:
+    """Raw signed transaction. ``transaction`` holds ``nonce``, ``gas``, ``value``, ``chainId``,
+    ``to`` (omitted for deploys), ``data`` and either ``gasPrice`` or the EIP-1559 fee fields."""
+    if "maxFeePerGas" in transaction:
+        fields = [transaction["chainId"], transaction["nonce"], transaction["maxPriorityFeePerGas"],
+                  transaction["maxFeePerGas"], transaction["gas"], _to(transaction), transaction.get("value", 0),
+                  _data(transaction), []]
+        signature = key.sign_msg_hash(keccak(_DYNAMIC_FEE_TYPE + rlp.encode(fields)))
+        return HexBytes(_DYNAMIC_FEE_TYPE + rlp.encode(fields + [signature.v, signature.r, signature.s]))
+    chain_id = transaction["chainId"]
+    fields = [transaction["nonce"], transaction["gasPrice"], transaction["gas"], _to(transaction),
+              transaction.get("value", 0), _data(transaction)]
+    signature = key.sign_msg_hash(keccak(rlp.encode(fields + [chain_id, 0, 0])))
+    return HexBytes(rlp.encode(fields + [signature.v + 35 + 2 * chain_id, signature.r, signature.s]))
+
+
+def sign_many(transactions: List[dict], account: eth_account.account.LocalAccount,
+              key: Optional[object] = None) -> List[HexBytes]:
+    """Signs transactions of one account with its cached key."""
+    key = key or get_signing_key(account)
+    return [sign_transaction(transaction, key) for transaction in transactions]
@@ -0,0 +1,139 @@
+"""Local nonce bookkeeping and non-blocking transaction handles."""
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Dict, List, Optional
+
+import web3
+from hexbytes import HexBytes
+from web3.exceptions import TimeExhausted, TransactionNotFound
+
+
+class NonceManager:
+    """Hands out nonces per account locally.
+
+    Nonce of an account is seeded once from the node ("pending" block) and then
+    incremented locally, so transactions can be sent back-to-back without waiting
+    for each other. ``resync`` drops the local value after a rejected transaction.
+    """
+
+    def __init__(self):
+        self._nonces: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def next_nonce(self, web3_instance: web3.Web3, address: str) -> int:
+        with self._lock:
+            nonce = self._nonces.get(address)
+            if nonce is None:
+                nonce = web3_instance.eth.get_transaction_count(address, "pending")
+            self._nonces[address] = nonce + 1
+            return nonce
+
+    def resync(self, address: str):
+        with self._lock:
+            self._nonces.pop(address, None)
+
+
+_nonce_managers: Dict[str, NonceManager] = {}
+_nonce_managers_lock = threading.Lock()
+
+
+def get_nonce_manager(rpc_address: str) -> NonceManager:
+    """Returns nonce manager shared by all wrappers connected to the same node."""
+    with _nonce_managers_lock:
+        if rpc_address not in _nonce_managers:
+            _nonce_managers[rpc_address] = NonceManager()
+        return _nonce_managers[rpc_address]
+
+
+# the nonce is taken by a mined or pending transaction
+NONCE_ERRORS = ("nonce too low", "correct nonce", "nonce is too low", "replacement transaction underpriced")
+# the node already has this very transaction, e.g. sent by an attempt that seemed to fail
+KNOWN_TRANSACTION_ERRORS = ("already known", "known transaction", "already imported", "already in the pool")
+
+
+def is_nonce_error(error) -> bool:
+    message = str(error).lower()
+    return any(nonce_error in message for nonce_error in NONCE_ERRORS)
+
+
+def is_known_transaction_error(error) -> bool:
+    message = str(error).lower()
+    return any(known_error in message for known_error in KNOWN_TRANSACTION_ERRORS)
+
+
+class BatchSendError(ValueError):
+    """Some transactions of a JSON-RPC batch were rejected.
+
+    ``pending`` is aligned with the sent transactions: handles of the accepted ones, so
+    they can still be waited for, and None for the rejected ones.
+    """
+
+    def __init__(self, errors: list, pending: List[Optional["PendingTransaction"]]):
+        super().__init__(errors[0])
+        self.errors = errors
+        self.pending = pending
+
+
+class PendingTransaction:
+    """Handle of a sent transaction, ``wait`` blocks until its receipt is available.
+
+    With ``receipt_future`` (from ``ReceiptWaiter.watch``) the receipt is resolved by the
+    shared block watcher, otherwise it is polled. ``timeout`` is the default of ``wait``,
+    the wrappers pass their ``receipt_timeout``.
+    """
+
+    def __init__(self, web3_instance: web3.Web3, tx_hash, receipt_future: Optional[Future] = None,
+                 timeout: float = 120):
+        self.web3 = web3_instance
+        self.tx_hash = tx_hash
+        self.receipt_future = receipt_future
+        self.timeout = timeout
+        self.receipt = None
+
+    def poll(self):
+        """Returns receipt if transaction is mined, ``None`` otherwise."""
+        if self.receipt is None:
+            if self.receipt_future is not None:
+                if self.receipt_future.done():
+                    self.receipt = self.receipt_future.result()
+                return self.receipt
+            try:
+                self.receipt = self.web3.eth.get_transaction_receipt(self.tx_hash)
+            except TransactionNotFound:
+                pass
+        return self.receipt
+
+    def wait(self, timeout: Optional[float] = None, poll_latency: float = 0.1):
+        if timeout is None:
+            timeout = self.timeout
+        if self.receipt is None:
+            if self.receipt_future is not None:
+                try:
+                    self.receipt = self.receipt_future.result(timeout)
+                except FutureTimeoutError:
+                    raise TimeExhausted(f"Transaction {HexBytes(self.tx_hash).hex()} is not in the chain "
+                                        f"after {timeout} seconds")
+            else:
+                self.receipt = self.web3.eth.wait_for_transaction_receipt(self.tx_hash, timeout, poll_latency)
+        return self.receipt
+
+
+def wait_all(pending: List[PendingTransaction], timeout: Optional[float] = None, poll_latency: float = 0.1) -> list:
+    """Waits for receipts of all transactions together, returns them in the same order.
+
+    ``timeout`` defaults to the longest ``timeout`` of the handles.
+    """
+    if timeout is None:
+        timeout = max((p.timeout for p in pending), default=0)
+    deadline = time.monotonic() + timeout
+    if all(p.receipt_future is not None for p in pending):
+        return [p.wait(max(0.0, deadline - time.monotonic())) for p in pending]
+    while True:
+        receipts = [p.poll() for p in pending]
+        if all(receipt is not None for receipt in receipts):
+            return receipts
+        if time.monotonic() > deadline:
+            raise TimeExhausted(f"{sum(p.receipt is None for p in pending)} transactions "
+                                f"are not in the chain after {timeout} seconds")
+        time.sleep(poll_latency)
@@ -0,0 +1,133 @@
+"""Off-chain preparation and pre-verification of the ZKP rounds checked by ``BlindAuction.ZKPVerify``."""
+import secrets
+from typing import Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from backend.pedersen import CURVE_ORDER, FIELD_MODULUS, Point, get_engine, get_process_pool
+
+# ``Q`` and ``V`` of the ``BlindAuction`` contract
+ZKP_Q = FIELD_MODULUS
+ZKP_V = 5472060717959818805561601436314318772174077789324455915672259473661306552145
+UINT256_MAX = 2 ** 256 - 1
+
+
+class ZKPRound(NamedTuple):
+    w1: int
+    w2: int
+    r1: int
+    r2: int
+    W1: Point
+    W2: Point
+
+
+class ZKPPreparation(NamedTuple):
+    address: str
+    x: int
+    r: int
+    rounds: List[ZKPRound]
+
+    @property
+    def commits(self) -> List[int]:
+        """Flat ``[W1x, W1y, W2x, W2y, ...]`` list as expected by ``ZKPCommit``."""
+        return [c for rnd in self.rounds for c in (*rnd.W1, *rnd.W2)]
+
+    @property
+    def response(self) -> List[int]:
+        """Flat ``[m, n, z]`` list of the b = 1 openings ``m = x + w1, n = r + r1, z = 1``."""
+        return [c for rnd in self.rounds for c in (self.x + rnd.w1, self.r + rnd.r1, 1)]
+
+
+def prepare_zkp_rounds(pedersen,
+                       bidders: Iterable[Tuple[str, int, int]],
+                       k: int,
+                       max_bid: int,
+                       processes: int = 0) -> List[ZKPPreparation]:
+    """Generates witnesses and commitments of ``k`` rounds for every bidder in one pass.
+
+    ``bidders`` are ``(address, x, r)`` tuples where ``x`` is the bid and ``r`` its blinding.
+    ``pedersen`` is anything with ``commit_many``: a ``Pedersen`` wrapper or ``PedersenEngine``.
+    For every round ``w1`` is drawn from ``[0, max_bid / 2]`` and ``w2 = w1 - max_bid``.
+    """
+    bidders = list(bidders)
+    witnesses = []
+    for _ in range(len(bidders) * k):
+        w1 = secrets.randbelow(max_bid // 2 + 1)
+        witnesses.append((w1, w1 - max_bid, secrets.randbelow(CURVE_ORDER), secrets.randbelow(CURVE_ORDER)))
+
+    # W1 and W2 of all rounds are interleaved so one commit_many call covers everything
+    values = [w for w1, w2, _, _ in witnesses for w in (w1, w2)]
+    blindings = [r for _, _, r1, r2 in witnesses for r in (r1, r2)]
+    dots = pedersen.commit_many(values, blindings, processes=processes)
+
+    result = []
+    for i, (address, x, r) in enumerate(bidders):
+        rounds = [ZKPRound(*witnesses[j], dots[2 * j], dots[2 * j + 1])
+                  for j in range(i * k, (i + 1) * k)]
+        result.append(ZKPPreparation(address, x, r, rounds))
+    return result
+
+
+class InvalidProofError(ValueError):
+    """Raised before sending proofs that ``ZKPVerify`` would reject, ``reasons`` maps bidder to reason."""
+
+    def __init__(self, reasons: Dict[str, str]):
+        super().__init__("; ".join(f"{address}: {reason}" for address, reason in reasons.items()))
+        self.reasons = reasons
+
+
+def check_proof(engine, commitment: Point, commits: Sequence[int], response: Sequence[int], k: int,
+                bits: Optional[Sequence[int]] = None) -> Optional[str]:
+    """Checks a proof by the rules of ``ZKPCommitVerify``/``ZKPVerifyBatch``, returns why it fails or None.
+
+    ``commitment`` is the ``(commitX, commitY)`` stored for the bidder. ``bits`` are the
+    challenge bits of the rounds; the contract currently always uses b = 1. For b = 0 a
+    round responds ``[w1, r1, w2, r2]`` and must satisfy ``(w1 + w2) % Q == V`` and open
+    W1 and W2. For b = 1 it responds ``[m, n, z]`` and ``Commit(m, n)`` must equal
+    ``C + W1`` for z = 1, ``C + W2`` otherwise.
+    """
+    if bits is None:
+        bits = [1] * k
+    if len(commits) != 4 * k:
+        return f"expected {4 * k} commits, got {len(commits)}"
+    if len(response) != sum(3 if b else 4 for b in bits):
+        return f"expected {sum(3 if b else 4 for b in bits)} response values, got {len(response)}"
+    if any(not 0 <= value <= UINT256_MAX for value in (*commits, *response)):
+        return "value out of uint256 range"
+    i = 0
+    for rnd, b in enumerate(bits):
+        W1, W2 = tuple(commits[4 * rnd:4 * rnd + 2]), tuple(commits[4 * rnd + 2:4 * rnd + 4])
+        try:
+            if b == 0:
+                w1, r1, w2, r2 = response[i:i + 4]
+                if w1 + w2 > UINT256_MAX or (w1 + w2) % ZKP_Q != ZKP_V:
+                    return f"round {rnd}: (w1 + w2) % Q != V"
+                if not engine.verify(w1, r1, *W1) or not engine.verify(w2, r2, *W2):
+                    return f"round {rnd}: W1/W2 are not opened by the response"
+                i += 4
+            else:
+                m, n, z = response[i:i + 3]
+                expected = engine.ec_add(*commitment, *(W1 if z == 1 else W2))
+                if engine.commit(m, n) != expected:
+                    return f"round {rnd}: Commit(m, n) != C + W{1 if z == 1 else 2}"
+                i += 3
+        except ValueError as e:  # point not on curve, the precompile call fails
+            return f"round {rnd}: {e}"
+    return None
+
+
+def check_proofs(parameters: dict, proofs: Sequence[Tuple[Point, Sequence[int], Sequence[int]]], k: int,
+                 processes: int = 0, chunk_size: int = 64) -> List[Optional[str]]:
+    """Runs ``check_proof`` for every ``(commitment, commits, response)``.
+
+    With ``processes`` > 1 chunks of proofs are spread across the shared process pool.
+    """
+    if processes > 1 and len(proofs) > chunk_size:
+        chunks = [(parameters, proofs[i:i + chunk_size], k) for i in range(0, len(proofs), chunk_size)]
+        pool = get_process_pool(processes)
+        return [reason for part in pool.map(_check_chunk, chunks) for reason in part]
+    return _check_chunk((parameters, proofs, k))
+
+
+def _check_chunk(args) -> List[Optional[str]]:
+    parameters, proofs, k = args
+    engine = get_engine(**parameters)
+    return [check_proof(engine, commitment, commits, response, k) for commitment, commits, response in proofs]
@@ -0,0 +1,88 @@
+"""Gas used by ZKP verification of one bidder for K = 1..10.
+
+Compares the two-transaction path (``ZKPCommit`` + ``ZKPVerify``) with the single
+``ZKPCommitVerify`` transaction. Runs against a local development chain, e.g. the one
+started by ``blockchain.sh`` (``ganache-cli --deterministic``)::
+
+    python -m benchmarks.gas_benchmark --output gas.json
+
+Exits with a non-zero status if the gas used by ``ZKPCommitVerify`` for some K exceeds
+``--max-gas-per-round * K``. ``test_gas_benchmark.py`` runs the same measurement as a
+pytest gas budget check.
+"""
+import argparse
+import json
+import secrets
+import sys
+from pathlib import Path
+
+from eth_account import Account
+
+from backend.evm_wrapper import BlindAuction, Pedersen
+from backend.zkp import prepare_zkp_rounds
+
+AUCTIONEER_KEY = "0x4f3edf983ac636a65a842ce7c78d9aa706d3b113bce9c46f30d7d21715b23b1d"
+
+
+def measure(rpc_address: str, contract_file: Path, pedersen: Pedersen, auctioneer, bidders, k: int) -> dict:
+    auction = BlindAuction(rpc_address, contract_file)
+    max_bid = pedersen.web3.toWei(10, "ether")
+    auction.deploy(maxBid=max_bid, bidBlockNumber=0, revealBlockNumber=0, winnerPaymentBlockNumber=0,
+                   maxBiddersCount=len(bidders), fairnessFees=1, pedersenAddress=pedersen.contact_address,
+                   k=k, testing=True, eth_pay_value=1, deploy_account=auctioneer)
+    bids = [(account, secrets.randbelow(max_bid), secrets.randbelow(pedersen.engine.parameters["q"]))
+            for account in bidders]
+    for account, x, r in bids:
+        cX, cY = pedersen.get_dot(x, r)
+        auction.bid(cX, cY, 1, account)
+    _, x, r = winner = max(bids, key=lambda bid: bid[1])
+    auction.claim_winner(winner[0].address, x, r, auctioneer)
+    proofs = prepare_zkp_rounds(pedersen, [(account.address, x, r) for account, x, r in bids], k, max_bid)
+
+    legacy, single = [], []
+    for proof in proofs:
+        commit_receipt = auction.zkp_commit(proof.address, proof.commits, auctioneer)
+        verify_receipt = auction.zkp_verify(proof.response, auctioneer)
+        legacy.append(commit_receipt["gasUsed"] + verify_receipt["gasUsed"])
+        single.append(auction.zkp_commit_verify(proof.address, proof.commits, proof.response,
+                                                auctioneer)["gasUsed"])
+    return {"legacy_per_bidder": sum(legacy) // len(legacy),
+            "commit_verify_per_bidder": sum(single) // len(single)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--rpc-address", default="http://127.0.0.1:8545")
+    parser.add_argument("--contract-file", type=Path, default=Path("contracts/contract.sol"))
+    parser.add_argument("--keys", type=Path, default=Path("keys"), help="Private keys of funded bidder accounts")
+    parser.add_argument("--bidders", type=int, default=3)
+    parser.add_argument("--max-k", type=int, default=10)
+    parser.add_argument("--max-gas-per-round", type=int, default=None)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+
+    auctioneer = Account.from_key(AUCTIONEER_KEY)
+    bidders = [Account.from_key(key) for key in args.keys.read_text().split()][:args.bidders]
+    pedersen = Pedersen(args.rpc_address, args.contract_file)
+    pedersen.deploy(deploy_account=auctioneer)
+
+    results = {}
+    for k in range(1, args.max_k + 1):
+        results[k] = measure(args.rpc_address, args.contract_file, pedersen, auctioneer, bidders, k)
+        print(f"K={k}: legacy {results[k]['legacy_per_bidder']}, "
+              f"ZKPCommitVerify {results[k]['commit_verify_per_bidder']} gas per bidder", file=sys.stderr)
+
+    report = json.dumps(results, indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        args.output.write_text(report)
+    if args.max_gas_per_round is not None:
+        exceeded = [k for k, result in results.items()
+                    if result["commit_verify_per_bidder"] > args.max_gas_per_round * k]
+        if exceeded:
+            sys.exit(f"ZKPCommitVerify gas exceeds {args.max_gas_per_round} per round for K={exceeded}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,212 @@
+"""Load test running full auction cycles against an in-process or local chain.
+
+Every cycle deploys a ``BlindAuction``, places bids, claims the winner and verifies the
+proofs of all bidders (``ZKPVerifyBatch`` + ``VerifyAll``). Cycles run in parallel, each
+one with its own freshly funded auctioneer and bidder accounts::
+
+    python -m benchmarks.load_test --chain eth-tester --auctions 4 --bidders 5 -k 3
+    python -m benchmarks.load_test --rpc-address http://127.0.0.1:8545 --concurrency 8 --output run.json
+
+``eth-tester`` needs ``eth-tester[py-evm]``, ``--rpc-address`` defaults to the ganache
+node of ``blockchain.sh``. The JSON report holds throughput, per-phase latency
+percentiles, JSON-RPC call counts, latencies and payload sizes (``backend.metrics``) and
+gas used per contract method.
+"""
+import argparse
+import json
+import logging
+import secrets
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from eth_account import Account
+from web3.providers import BaseProvider
+
+from backend.evm_wrapper import BaseContractWrapper, BlindAuction, Pedersen
+from backend.fees import gas_stats
+from backend.metrics import rpc_metrics
+from backend.transactions import PendingTransaction, wait_all
+from backend.zkp import prepare_zkp_rounds
+
+logger = logging.getLogger(__name__)
+
+# first account of ``ganache-cli --deterministic``
+GANACHE_FUNDER_KEY = "0x4f3edf983ac636a65a842ce7c78d9aa706d3b113bce9c46f30d7d21715b23b1d"
+# first default account of eth-tester
+ETH_TESTER_FUNDER_KEY = "0x" + "00" * 31 + "01"
+PHASES = ("deploy", "bid", "claim", "prove", "verify")
+
+
+class SerializedProvider(BaseProvider):
+    """Serializes requests to a provider that is not thread-safe, like ``EthereumTesterProvider``."""
+
+    def __init__(self, provider: BaseProvider):
+        self.provider = provider
+        self.middlewares = provider.middlewares
+        self._lock = threading.Lock()
+
+    def make_request(self, method, params):
+        with self._lock:
+            return self.provider.make_request(method, params)
+
+    def isConnected(self) -> bool:
+        return self.provider.isConnected()
+
+
+class LoadTest:
+    def __init__(self, rpc_address: str, contract_file: Path, provider: Optional[BaseProvider], funder_key: str,
+                 bidders: int, k: int, fund_wei: int):
+        self.rpc_address = rpc_address
+        self.contract_file = contract_file
+        self.provider = provider
+        self.funder = Account.from_key(funder_key)
+        self.bidders = bidders
+        self.k = k
+        self.fund_wei = fund_wei
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors = 0
+        self._lock = threading.Lock()
+        self.pedersen = self.wrapper(Pedersen)
+        self.web3 = self.pedersen.web3
+
+    def wrapper(self, wrapper_class):
+        return wrapper_class(self.rpc_address, self.contract_file, provider=self.provider)
+
+    def fund(self, count: int) -> list:
+        """Creates ``count`` accounts and funds them from the funder account."""
+        accounts = [Account.create() for _ in range(count)]
+        chain_id = self.web3.eth.chain_id
+        gas_price = self.web3.eth.gas_price
+        pending = []
+        for account in accounts:
+            transaction = {'to': account.address, 'value': self.fund_wei, 'gas': 21000, 'gasPrice': gas_price,
+                           'chainId': chain_id,
+                           'nonce': self.pedersen.nonce_manager.next_nonce(self.web3, self.funder.address)}
+            tx_hash = self.web3.eth.sendRawTransaction(self.funder.sign_transaction(transaction).rawTransaction)
+            pending.append(PendingTransaction(self.web3, tx_hash, self.pedersen.receipt_waiter.watch(tx_hash)))
+        wait_all(pending, timeout=BaseContractWrapper.receipt_timeout)
+        return accounts
+
+    def _timed(self, phase: str, fn, *args, **kwargs):
+        start = time.perf_counter()
+        result = fn(*args, **kwargs)
+        with self._lock:
+            self.latencies[phase].append(time.perf_counter() - start)
+        return result
+
+    def cycle(self, auctioneer, bidders):
+        auction = self.wrapper(BlindAuction)
+        max_bid = self.web3.toWei(1, "ether")
+        self._timed("deploy", auction.deploy, maxBid=max_bid, bidBlockNumber=0, revealBlockNumber=0,
+                    winnerPaymentBlockNumber=0, maxBiddersCount=len(bidders), fairnessFees=1,
+                    pedersenAddress=self.pedersen.contact_address, k=self.k, testing=True, eth_pay_value=1,
+                    deploy_account=auctioneer)
+        bids = [(account, secrets.randbelow(max_bid), secrets.randbelow(self.pedersen.engine.parameters["q"]))
+                for account in bidders]
+
+        def bid():
+            commits = self.pedersen.commit_many([x for _, x, _ in bids], [r for _, _, r in bids])
+            wait_all([auction.bid(cX, cY, 1, account, wait=False)
+                      for (account, _, _), (cX, cY) in zip(bids, commits)])
+
+        self._timed("bid", bid)
+        winner, x, r = max(bids, key=lambda bid: bid[1])
+        self._timed("claim", auction.claim_winner, winner.address, x, r, auctioneer)
+        proofs = self._timed("prove", prepare_zkp_rounds, self.pedersen,
+                             [(account.address, x, r) for account, x, r in bids], self.k, max_bid)
+
+        def verify():
+            pending = auction.zkp_verify_batch([(proof.address, proof.commits, proof.response) for proof in proofs],
+                                               auctioneer, wait=False)
+            pending.append(auction.verify_all(auctioneer, wait=False))
+            receipts = wait_all(pending, timeout=BaseContractWrapper.receipt_timeout)
+            if not all(receipt["status"] for receipt in receipts):
+                raise RuntimeError(f"Verification of auction {auction.contact_address} failed")
+
+        self._timed("verify", verify)
+
+    def _run_cycle(self, auctioneer, bidders):
+        try:
+            self._timed("cycle", self.cycle, auctioneer, bidders)
+        except Exception:
+            logger.exception("Auction cycle failed")
+            with self._lock:
+                self.errors += 1
+
+    def run(self, auctions: int, concurrency: int) -> dict:
+        self.pedersen.deploy(deploy_account=self.funder)
+        accounts = self.fund(auctions * (self.bidders + 1))
+        participants = [(accounts[i], accounts[i + 1:i + 1 + self.bidders])
+                        for i in range(0, len(accounts), self.bidders + 1)]
+        rpc_metrics.reset()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for auctioneer, bidders in participants:
+                executor.submit(self._run_cycle, auctioneer, bidders)
+        duration = time.perf_counter() - start
+        rpc = rpc_metrics.summary()
+        transactions = rpc.get("rpc:eth_sendRawTransaction", {}).get("count", 0)
+        return {
+            "config": {"auctions": auctions, "bidders": self.bidders, "k": self.k, "concurrency": concurrency},
+            "duration": duration,
+            "errors": self.errors,
+            "throughput": {"auctions_per_second": (auctions - self.errors) / duration,
+                           "transactions_per_second": transactions / duration},
+            "latency": {phase: percentiles(self.latencies[phase]) for phase in (*PHASES, "cycle")
+                        if self.latencies[phase]},
+            "rpc": rpc,
+            "gas": gas_stats.summary(),
+        }
+
+
+def percentiles(samples: List[float]) -> dict:
+    samples = sorted(samples)
+
+    def rank(p):
+        return samples[min(len(samples) - 1, int(p / 100 * len(samples)))]
+
+    return {"count": len(samples), "mean": sum(samples) / len(samples),
+            "p50": rank(50), "p90": rank(90), "p99": rank(99), "max": samples[-1]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--chain", choices=("rpc", "eth-tester"), default="rpc")
+    parser.add_argument("--rpc-address", default="http://127.0.0.1:8545")
+    parser.add_argument("--funder-key", default=None, help="Private key of the account funding test accounts")
+    parser.add_argument("--contract-file", type=Path, default=Path("contracts/contract.sol"))
+    parser.add_argument("--auctions", type=int, default=4)
+    parser.add_argument("--bidders", type=int, default=5)
+    parser.add_argument("-k", type=int, default=3, help="Number of ZKP rounds")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--fund-ether", type=int, default=10)
+    parser.add_argument("--output", type=Path, default=None)
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.chain == "eth-tester":
+        from web3 import EthereumTesterProvider
+        rpc_address, provider = "eth-tester", SerializedProvider(EthereumTesterProvider())
+        funder_key = args.funder_key or ETH_TESTER_FUNDER_KEY
+    else:
+        rpc_address, provider = args.rpc_address, None
+        funder_key = args.funder_key or GANACHE_FUNDER_KEY
+
+    load_test = LoadTest(rpc_address, args.contract_file, provider, funder_key, args.bidders, args.k,
+                         args.fund_ether * 10 ** 18)
+    report = json.dumps(load_test.run(args.auctions, args.concurrency), indent=2)
+    if args.output is None:
+        print(report)
+    else:
+        args.output.write_text(report)
+    if load_test.errors:
+        sys.exit(f"{load_test.errors} of {args.auctions} auction cycles failed")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""Gas budget of ``ZKPCommitVerify`` for K = 1..10, see ``gas_benchmark.py``.
+
+Runs against the local chain of ``blockchain.sh`` (``RPC_ADDRESS``, funded keys in
+``keys``) and is skipped when it is not running::
+
+    python -m pytest benchmarks/test_gas_benchmark.py
+
+``GAS_BASE`` and ``GAS_PER_ROUND`` set the budget of one bidder: ``GAS_BASE + GAS_PER_ROUND * K``.
+"""
+import os
+from pathlib import Path
+
+import pytest
+import requests
+import web3
+from eth_account import Account
+
+from benchmarks.gas_benchmark import AUCTIONEER_KEY, measure
+
+RPC_ADDRESS = os.environ.get("RPC_ADDRESS", "http://127.0.0.1:8545")
+CONTRACT_FILE = Path(__file__).parent.parent / "contracts" / "contract.sol"
+KEYS_FILE = Path(__file__).parent.parent / "keys"
+GAS_BASE = int(os.environ.get("GAS_BASE", "60000"))
+GAS_PER_ROUND = int(os.environ.get("GAS_PER_ROUND", "20000"))
+BIDDERS = 3
+
+
+@pytest.fixture(scope="module")
+def chain():
+    try:
+        connected = web3.Web3(web3.HTTPProvider(RPC_ADDRESS, request_kwargs={"timeout": 2})).is_connected()
+    except requests.RequestException:
+        connected = False
+    if not connected:
+        pytest.skip(f"No local chain at {RPC_ADDRESS}")
+    pytest.importorskip("solcx")
+    from backend.evm_wrapper import Pedersen
+    auctioneer = Account.from_key(AUCTIONEER_KEY)
+    bidders = [Account.from_key(key) for key in KEYS_FILE.read_text().split()][:BIDDERS]
+    pedersen = Pedersen(RPC_ADDRESS, CONTRACT_FILE)
+    pedersen.deploy(deploy_account=auctioneer)
+    return pedersen, auctioneer, bidders
+
+
+@pytest.mark.parametrize("k", range(1, 11))
+def test_commit_verify_gas(chain, k):
+    pedersen, auctioneer, bidders = chain
+    result = measure(RPC_ADDRESS, CONTRACT_FILE, pedersen, auctioneer, bidders, k)
+    assert result["commit_verify_per_bidder"] <= GAS_BASE + GAS_PER_ROUND * k
+    assert result["commit_verify_per_bidder"] < result["legacy_per_bidder"]
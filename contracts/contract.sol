@@ -1,6 +1,46 @@
 pragma solidity >=0.7.0 <0.9.0;
 // SPDX-License-Identifier: MIT
 
+// Операции над alt_bn128 через прекомпайлы без выделения памяти:
+// вход и выход пишутся в scratch-область по free memory pointer, которая не сдвигается,
+// поэтому одна и та же область переиспользуется во всех раундах ZKP.
+library AltBn128 {
+    function ecMul(uint b, uint cX1, uint cY1) internal view returns (uint cX2, uint cY2) {
+        bool success;
+        assembly {
+            let p := mload(0x40)
+            mstore(p, cX1)
+            mstore(add(p, 32), cY1)
+            mstore(add(p, 64), b)
+            success := staticcall(gas(), 7, p, 96, p, 64)
+            cX2 := mload(p)
+            cY2 := mload(add(p, 32))
+        }
+        require(success);
+    }
+
+    function ecAdd(uint cX1, uint cY1, uint cX2, uint cY2) internal view returns (uint cX3, uint cY3) {
+        bool success;
+        assembly {
+            let p := mload(0x40)
+            mstore(p, cX1)
+            mstore(add(p, 32), cY1)
+            mstore(add(p, 64), cX2)
+            mstore(add(p, 96), cY2)
+            success := staticcall(gas(), 6, p, 128, p, 64)
+            cX3 := mload(p)
+            cY3 := mload(add(p, 32))
+        }
+        require(success);
+    }
+
+    function commit(uint b, uint r, uint gX, uint gY, uint hX, uint hY) internal view returns (uint cX, uint cY) {
+        (uint cX1, uint cY1) = ecMul(b, gX, gY);
+        (cX, cY) = ecMul(r, hX, hY);
+        return ecAdd(cX1, cY1, cX, cY);
+    }
+}
+
 contract Pedersen {
     //uint public q =  21888242871839275222246405745257275088548364400416034343698204186575808495617;
     uint private q = 21888242871839275222246405745257275088696311157297823662689037894645226208583;
@@ -17,6 +57,10 @@ contract Pedersen {
         hY = _hY;
     }
 
+    function Parameters() external view returns (uint, uint, uint, uint, uint) {
+        return (q, gX, gY, hX, hY);
+    }
+
     function Commit(uint b, uint r) public returns (uint cX, uint cY) {
         (uint cX1, uint cY1) = ecMul(b, gX, gY);
         (uint cX2, uint cY2) = ecMul(r, hX, hY);
@@ -63,6 +107,10 @@ contract Pedersen {
 contract AuctionsBox{
     address public admin;
     address[] public opened_auctions;
+
+    event AuctionAdded(address indexed auction, address indexed auctioneer, uint idx);
+    event AuctionClosed(address indexed auction, uint idx);
+
     constructor () {
         admin = msg.sender;
     }
@@ -73,14 +121,18 @@ contract AuctionsBox{
 
     function addAuction(address addr) public {
         BlindAuction auction_addr = BlindAuction(addr);
-        require(msg.sender == admin || msg.sender == auction_addr.auctioneerAddress());
+        address auctioneer = auction_addr.auctioneerAddress();
+        require(msg.sender == admin || msg.sender == auctioneer);
         opened_auctions.push(addr);
+        emit AuctionAdded(addr, auctioneer, opened_auctions.length - 1);
     }
 
 
     function closeAuction(uint idx) public {
-        require(msg.sender == admin || msg.sender == BlindAuction(opened_auctions[idx]).auctioneerAddress());
+        address addr = opened_auctions[idx];
+        require(msg.sender == admin || msg.sender == BlindAuction(addr).auctioneerAddress());
         delete opened_auctions[idx];
+        emit AuctionClosed(addr, idx);
     }
 
 }
@@ -97,6 +149,11 @@ contract BlindAuction {
         bool existing;
     }
     Pedersen pedersen;
+    // Параметры схемы Педерсена копируются при создании аукциона, чтобы проверять ZKP без внешних вызовов
+    uint private immutable gX;
+    uint private immutable gY;
+    uint private immutable hX;
+    uint private immutable hY;
     bool withdrawLock;
     VerificationStates public states;
     address private challengedBidder;
@@ -124,6 +181,16 @@ contract BlindAuction {
     // Рандомное число для ZKP
     uint8 public number_zkp = 221;
 
+    // События для индексатора (backend/indexer.py)
+    event BidPlaced(address indexed bidder, uint cX, uint cY);
+    event Revealed(address indexed bidder);
+    event ZKPCommitted(address indexed bidder);
+    event ZKPVerified(address indexed bidder);
+    event WinnerClaimed(address indexed winner, uint bid);
+    event AllVerified(address indexed winner);
+    event Withdrawn(address indexed bidder, uint amount);
+    event WinnerPaid(address indexed winner, uint amount);
+
 
     // Как это работает:
     // 1. Создается аукцион, в параметрах которого задается:
@@ -182,13 +249,37 @@ contract BlindAuction {
         maxBiddersCount = _maxBiddersCount;
         fairnessFees = _fairnessFees;
         pedersen = Pedersen(pedersenAddress);
+        (uint _gX, uint _gY, uint _hX, uint _hY) = pedersenGenerators(pedersen);
+        gX = _gX;
+        gY = _gY;
+        hX = _hX;
+        hY = _hY;
         K= k;
         testing = _testing;
     }
 
+    function pedersenGenerators(Pedersen _pedersen) private returns (uint _gX, uint _gY, uint _hX, uint _hY) {
+        try _pedersen.Parameters() returns (uint, uint pgX, uint pgY, uint phX, uint phY) {
+            return (pgX, pgY, phX, phY);
+        } catch {
+            // Pedersen deployed before Parameters() existed: G = Commit(1, 0), H = Commit(0, 1)
+            (_gX, _gY) = _pedersen.Commit(1, 0);
+            (_hX, _hY) = _pedersen.Commit(0, 1);
+        }
+    }
+
     function getPedersenAddr() public returns(address) {
         return(address(pedersen));
     }
+
+    function biddersCount() external view returns(uint) {
+        return indexs.length;
+    }
+
+    // Бидер и коммиты последнего ZKPCommit, по ним ответ проверяется до отправки ZKPVerify
+    function zkpChallenge() external view returns(address, uint[] memory) {
+        return (challengedBidder, commits);
+    }
     function Bid(uint cX, uint cY) public payable {
         require(block.number < bidBlockNumber || testing);   //during bidding Interval
         require(indexs.length < maxBiddersCount); //available slot
@@ -196,11 +287,13 @@ contract BlindAuction {
         require(bidders[msg.sender].existing == false);
         bidders[msg.sender] = Bidder(cX, cY,"", false, false,true);
         indexs.push(msg.sender);
+        emit BidPlaced(msg.sender, cX, cY);
     }
     function Reveal(bytes memory cipher) public {
         require(block.number < revealBlockNumber && block.number > bidBlockNumber || testing);
         require(bidders[msg.sender].existing ==true); //existing bidder
         bidders[msg.sender].cipher = cipher;
+        emit Revealed(msg.sender);
     }
 
     function ZKPCommit(address y, uint[] memory _commits) public challengeByAuctioneer {
@@ -216,6 +309,7 @@ contract BlindAuction {
                 commits[i] = _commits[i];
             }
         states = VerificationStates.Verify;
+        emit ZKPCommitted(y);
     }
 
     function get_bit(uint8 _number, uint8 _k) pure internal returns(uint8) {
@@ -242,8 +336,8 @@ contract BlindAuction {
                 // структура response = [w1, r1, w2, r2]
                 // структура commits = [коорд x точки W1, коорд y точки W1, коорд x точки W2, коорд y точки W2]
                 require((response[i] + response[i+2])%Q==V);
-                require(pedersen.Verify(response[i], response[i+1], commits[j], commits[j+1]));
-                require(pedersen.Verify(response[i+2], response[i+3], commits[j+2], commits[j+3]));
+                require(verifyCommit(response[i], response[i+1], commits[j], commits[j+1]));
+                require(verifyCommit(response[i+2], response[i+3], commits[j+2], commits[j+3]));
                 i+=4;
             } else {
                 // b = 1
@@ -252,11 +346,11 @@ contract BlindAuction {
                 if(response[i+2] ==1) //z=1
 
                 // ecAdd(uint cX1, uint cY1, uint cX2, uint cY2)
-                    (cX, cY) = pedersen.ecAdd(bidders[challengedBidder].commitX, bidders[challengedBidder].commitY, commits[j], commits[j+1]);
+                    (cX, cY) = AltBn128.ecAdd(bidders[challengedBidder].commitX, bidders[challengedBidder].commitY, commits[j], commits[j+1]);
                 else
-                    (cX, cY) = pedersen.ecAdd(bidders[challengedBidder].commitX, bidders[challengedBidder].commitY, commits[j+2], commits[j+3]);
+                    (cX, cY) = AltBn128.ecAdd(bidders[challengedBidder].commitX, bidders[challengedBidder].commitY, commits[j+2], commits[j+3]);
                 // Рассчитали новые координаты cX и cY и переходим к верификации
-                require(pedersen.Verify(response[i], response[i+1], cX, cY));
+                require(verifyCommit(response[i], response[i+1], cX, cY));
                 i+=3;
             }
             j+=4;
@@ -292,9 +386,60 @@ contract BlindAuction {
         // require(count==K);
 
         bidders[challengedBidder].validProofs = true;
+        emit ZKPVerified(challengedBidder);
 
         // states = VerificationStates.Challenge;
     }
+
+    function verifyCommit(uint b, uint r, uint cX, uint cY) internal view returns (bool) {
+        (uint cX2, uint cY2) = AltBn128.commit(b, r, gX, gY, hX, hY);
+        return cX == cX2 && cY == cY2;
+    }
+
+    // Проверка всех K раундов доказательства бидера y (ветка b = 1, как в ZKPVerify),
+    // commits и response берутся из calldata, поэтому массив commits в storage не перезаписывается
+    function verifyProof(address y, uint[] calldata _commits, uint[] calldata response) internal view {
+        require(_commits.length == K * 4 && response.length == K * 3);
+        require(bidders[y].existing == true); // existing bidder
+        uint commitX = bidders[y].commitX;
+        uint commitY = bidders[y].commitY;
+        uint cX;
+        uint cY;
+        for (uint k = 0; k < K; k++) {
+            // структура response = [m, n, z]
+            if (response[k * 3 + 2] == 1) //z=1
+                (cX, cY) = AltBn128.ecAdd(commitX, commitY, _commits[k * 4], _commits[k * 4 + 1]);
+            else
+                (cX, cY) = AltBn128.ecAdd(commitX, commitY, _commits[k * 4 + 2], _commits[k * 4 + 3]);
+            require(verifyCommit(response[k * 3], response[k * 3 + 1], cX, cY));
+        }
+    }
+
+    // ZKPCommit + ZKPVerify одной транзакцией
+    function ZKPCommitVerify(address y, uint[] calldata _commits, uint[] calldata response) external challengeByAuctioneer {
+        require(states == VerificationStates.Challenge || testing);
+        verifyProof(y, _commits, response);
+        bidders[y].validProofs = true;
+        emit ZKPVerified(y);
+    }
+
+    // Проверка доказательств нескольких бидеров одной транзакцией,
+    // commits и response бидеров идут подряд: по K*4 и K*3 элемента на бидера
+    function ZKPVerifyBatch(address[] calldata _bidders, uint[] calldata _commits, uint[] calldata response) external challengeByAuctioneer {
+        require(states == VerificationStates.Challenge || testing);
+        uint commitsLength = uint(K) * 4;
+        uint responseLength = uint(K) * 3;
+        require(_commits.length == _bidders.length * commitsLength);
+        require(response.length == _bidders.length * responseLength);
+        for (uint i = 0; i < _bidders.length; i++) {
+            verifyProof(_bidders[i],
+                _commits[i * commitsLength:(i + 1) * commitsLength],
+                response[i * responseLength:(i + 1) * responseLength]);
+            bidders[_bidders[i]].validProofs = true;
+            emit ZKPVerified(_bidders[i]);
+        }
+    }
+
     function VerifyAll() public challengeByAuctioneer {
         for (uint i = 0; i<indexs.length; i++)
                 if(indexs[i] != winner)
@@ -304,6 +449,7 @@ contract BlindAuction {
                     }
 
         states = VerificationStates.ValidWinner;
+        emit AllVerified(winner);
     }
 
 
@@ -311,10 +457,11 @@ contract BlindAuction {
         require(states == VerificationStates.Init);
         require(bidders[_winner].existing == true); //existing bidder
         require(_bid < V); //valid bid
-        require(pedersen.Verify(_bid, _r, bidders[_winner].commitX, bidders[_winner].commitY)); //valid open of winner's commit
+        require(verifyCommit(_bid, _r, bidders[_winner].commitX, bidders[_winner].commitY)); //valid open of winner's commit
         winner = _winner;
         highestBid = _bid;
         states = VerificationStates.Challenge;
+        emit WinnerClaimed(_winner, _bid);
     }
 
 
@@ -327,11 +474,13 @@ contract BlindAuction {
         payable(msg.sender).transfer(fairnessFees);
         bidders[msg.sender].paidBack = true;
         withdrawLock = false;
+        emit Withdrawn(msg.sender, fairnessFees);
     }
     function WinnerPay() public payable {
         require(states == VerificationStates.ValidWinner);
         require(msg.sender == winner);
         require(msg.value >= highestBid - fairnessFees);
+        emit WinnerPaid(msg.sender, msg.value);
     }
     function Destroy() public {
         selfdestruct(payable(auctioneerAddress));
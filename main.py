@@ -1,32 +1,242 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, List, Optional
+
 import uvicorn as uvicorn
-from fastapi import FastAPI
+from fastapi import FastAPI, HTTPException, Query
+from fastapi.responses import PlainTextResponse
+from pydantic import BaseModel
+
+from backend.evm_wrapper import AuctionsBox, BaseContractWrapper, BlindAuction, Pedersen
+from backend.indexer import AuctionIndexer, AuctionStore
+from backend.jobs import JobManager
+from backend.metrics import rpc_metrics
+from backend.signing import SignerRegistry
+from backend.zkp import InvalidProofError
+
+RPC_ADDRESS = os.environ.get("RPC_ADDRESS", "http://127.0.0.1:8545")  # comma separated nodes of one chain
+CONTRACT_FILE = Path(os.environ.get("CONTRACT_FILE", "contracts/contract.sol"))
+# Optional already deployed contracts shared by all auctions
+PEDERSEN_ADDRESS = os.environ.get("PEDERSEN_ADDRESS")
+AUCTIONS_BOX_ADDRESS = os.environ.get("AUCTIONS_BOX_ADDRESS")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+INDEXER_DB = os.environ.get("INDEXER_DB", "auctions.sqlite3")
+INDEXER_START_BLOCK = int(os.environ.get("INDEXER_START_BLOCK", "0"))
+INDEXER_CONFIRMATIONS = int(os.environ.get("INDEXER_CONFIRMATIONS", "0"))
+TX_CONFIRMATIONS = int(os.environ.get("TX_CONFIRMATIONS", "0"))  # blocks on top of a receipt before it counts
+# Signing keys are configured on the server (SIGNER_KEYS_FILE, SIGNER_KEYSTORE), requests name the account
 
 app = FastAPI()
 
 
+class WrapperPool:
+    """Wrappers created once at startup, ``BlindAuction`` wrappers are kept per auction address."""
+
+    def __init__(self, rpc_address: str, contract_file: Path):
+        self.rpc_address = rpc_address
+        self.contract_file = contract_file
+        self.pedersen = Pedersen(rpc_address, contract_file)
+        self.pedersen.contact_address = PEDERSEN_ADDRESS
+        self.auctions_box = AuctionsBox(rpc_address, contract_file)
+        self.auctions_box.contact_address = AUCTIONS_BOX_ADDRESS
+        self._auctions: Dict[str, BlindAuction] = {}
+        self._lock = threading.Lock()
+        self._pedersen_lock = threading.Lock()
+
+    def auction(self, address: str) -> BlindAuction:
+        with self._lock:
+            auction = self._auctions.get(address)
+            if auction is None:
+                auction = BlindAuction(self.rpc_address, self.contract_file)
+                auction.contact_address = address
+                self._auctions[address] = auction
+            return auction
+
+    def pedersen_address(self, account) -> str:
+        """Address of the shared ``Pedersen``, deployed from ``account`` when none is configured."""
+        with self._pedersen_lock:
+            if self.pedersen.contact_address is None:
+                self.pedersen.deploy(deploy_account=account)
+            return self.pedersen.contact_address
+
+
+class CreateAuctionRequest(BaseModel):
+    account: str
+    max_bid: int
+    bid_block_number: int
+    reveal_block_number: int
+    winner_payment_block_number: int
+    max_bidders_count: int
+    fairness_fees: int
+    k: int = 10
+    testing: bool = False
+    eth_pay_value: int
+    pedersen_address: Optional[str] = None
+
+
+class BidRequest(BaseModel):
+    account: str
+    auction_address: str
+    cX: int
+    cY: int
+    value: int
+
+
+class CommitRequest(BaseModel):
+    account: str
+    auction_address: str
+    bidder: str
+    commits: List[int]
+
+
+class VerifyRequest(BaseModel):
+    account: str
+    auction_address: str
+    response: Optional[List[int]] = None
+    # with both the proof is committed and verified in one transaction
+    bidder: Optional[str] = None
+    commits: Optional[List[int]] = None
+    verify_all: bool = False
+
+
+@app.on_event("startup")
+def startup():
+    BaseContractWrapper.confirmations = TX_CONFIRMATIONS
+    app.state.wrappers = WrapperPool(RPC_ADDRESS, CONTRACT_FILE)
+    app.state.jobs = JobManager(max_workers=JOB_WORKERS)
+    app.state.signers = SignerRegistry.from_environment()
+    app.state.indexer = None
+    if AUCTIONS_BOX_ADDRESS is not None:
+        app.state.indexer = AuctionIndexer(app.state.wrappers.auctions_box,
+                                           BlindAuction(RPC_ADDRESS, CONTRACT_FILE),
+                                           AuctionStore(INDEXER_DB),
+                                           start_block=INDEXER_START_BLOCK,
+                                           confirmations=INDEXER_CONFIRMATIONS)
+        app.state.indexer.start()
+
+
+@app.on_event("shutdown")
+def shutdown():
+    app.state.jobs.shutdown()
+    if app.state.indexer is not None:
+        app.state.indexer.stop()
+
+
+def _tx_response(pending) -> dict:
+    return {"tx_hash": pending.tx_hash.hex()}
+
+
+def _signer(address: str):
+    try:
+        return app.state.signers.get(address)
+    except (KeyError, ValueError):
+        raise HTTPException(status_code=403, detail=f"No signing key is configured for {address}")
+
+
+def _send(method, *args, **kwargs) -> dict:
+    """Sends transaction without waiting for its receipt."""
+    try:
+        return _tx_response(method(*args, **kwargs, wait=False))
+    except ValueError as e:  # rejected by the node
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def _create_auction(request: CreateAuctionRequest, account) -> dict:
+    wrappers: WrapperPool = app.state.wrappers
+    pedersen_address = request.pedersen_address or wrappers.pedersen_address(account)
+    auction = BlindAuction(wrappers.rpc_address, wrappers.contract_file)
+    auction_address = auction.deploy(maxBid=request.max_bid,
+                                     bidBlockNumber=request.bid_block_number,
+                                     revealBlockNumber=request.reveal_block_number,
+                                     winnerPaymentBlockNumber=request.winner_payment_block_number,
+                                     maxBiddersCount=request.max_bidders_count,
+                                     fairnessFees=request.fairness_fees,
+                                     pedersenAddress=pedersen_address,
+                                     k=request.k,
+                                     testing=request.testing,
+                                     eth_pay_value=request.eth_pay_value,
+                                     deploy_account=account)
+    if wrappers.auctions_box.contact_address is not None:
+        wrappers.auctions_box.add_auction(auction_address, account)
+    return {"auction_address": auction_address, "pedersen_address": pedersen_address}
+
+
+def _verify_all(auction: BlindAuction, account) -> dict:
+    receipt = auction.verify_all(account)
+    return {"tx_hash": receipt["transactionHash"].hex(), "status": receipt["status"], "winner": auction.winner}
+
+
 @app.post(path="/api/v1/create_auction")
-def create():
-    pass
+def create(request: CreateAuctionRequest):
+    job = app.state.jobs.submit("create_auction", _create_auction, request, _signer(request.account))
+    return {"job_id": job.id}
 
 
 @app.post(path="/api/v1/bid")
-def bid():
-    pass
+def bid(request: BidRequest):
+    auction = app.state.wrappers.auction(request.auction_address)
+    return _send(auction.bid, request.cX, request.cY, request.value, _signer(request.account))
 
 
 @app.post(path="/api/v1/verify")
-def verify():
-    pass
+def verify(request: VerifyRequest):
+    auction = app.state.wrappers.auction(request.auction_address)
+    if request.verify_all:
+        job = app.state.jobs.submit("verify_all", _verify_all, auction, _signer(request.account))
+        return {"job_id": job.id}
+    if request.response is None:
+        raise HTTPException(status_code=422, detail="Either response or verify_all is required")
+    account = _signer(request.account)
+    if request.commits is not None:
+        if request.bidder is None:
+            raise HTTPException(status_code=422, detail="bidder is required with commits")
+        return _send(auction.zkp_commit_verify, request.bidder, request.commits, request.response, account)
+    # ZKPVerify checks the commits stored by ZKPCommit, check the response against them first
+    challenge = auction.zkp_challenge()
+    if challenge is not None:  # None: deployed without zkpChallenge, the contract alone checks it
+        try:
+            auction.preverify([(*challenge, request.response)])
+        except InvalidProofError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    return _send(auction.zkp_verify, request.response, account)
 
 
 @app.post(path="/api/v1/commit")
-def commit():
-    pass
+def commit(request: CommitRequest):
+    auction = app.state.wrappers.auction(request.auction_address)
+    return _send(auction.zkp_commit, request.bidder, request.commits, _signer(request.account))
 
 
 @app.get("/api/v1/list_all_auctions")
-def list_all():
-    pass
+def list_all(limit: int = Query(50, ge=1, le=1000),
+             cursor: Optional[int] = None,
+             state: Optional[str] = None,
+             auctioneer: Optional[str] = None,
+             from_block: Optional[int] = None,
+             to_block: Optional[int] = None,
+             include_closed: bool = False):
+    indexer: Optional[AuctionIndexer] = app.state.indexer
+    if indexer is None:
+        raise HTTPException(status_code=503, detail="AUCTIONS_BOX_ADDRESS is not configured")
+    auctions, next_cursor = indexer.store.list_auctions(limit=limit, cursor=cursor, state=state,
+                                                        auctioneer=auctioneer, from_block=from_block,
+                                                        to_block=to_block, include_closed=include_closed)
+    return {"auctions": auctions, "next_cursor": next_cursor, "indexed_block": indexer.store.last_block}
+
+
+@app.get("/api/v1/jobs/{job_id}")
+def job_status(job_id: str):
+    job = app.state.jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return job.as_dict()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """JSON-RPC latency, payload size, gas and auction manager metrics in the Prometheus text format."""
+    return PlainTextResponse(rpc_metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
 
 
 if __name__ == '__main__':
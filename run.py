@@ -1,7 +1,8 @@
 from pathlib import Path
-import random
 
 from backend.evm_wrapper import BlindAuction, Pedersen
+from backend.transactions import wait_all
+from backend.zkp import prepare_zkp_rounds
 
 rpc = "http://127.0.0.1:8545"
 
@@ -27,8 +28,6 @@ auction_params = {
     "k": 1,  # Количество раундов доказательства
     "testing": True,  # Обход проверки блоков, включает тестовый режим
     "eth_pay_value": 1,  # Сколько заплатить при инициализации аукциона
-    "gas": 4712388,
-    "gas_price": 100000000000,
 }
 
 # Deploy contracts from auctioneer
@@ -43,29 +42,30 @@ def get_bs(number, w1, w2, r1, r2, r, x):
 
 # create bids from users
 def create_bid(r, x, value=1000):
-    result = []
     for account in users_accounts:
         cX, cY = perdesen.get_dot(x, r)
         auction.bid(cX, cY, value, account)
-        w1 = random.randint(0, auction.max_bid / 2)
-        w2 = w1 - auction.max_bid
-        r1 = random.randint(0, auction.max_bid / 2)
-        r2 = random.randint(0, auction.max_bid / 2)
-        W1x, W1y = perdesen.get_dot(w1, r1)
-        W2x, W2y = perdesen.get_dot(w2, r2)
-        result.append([account.address, w1, w2, r1, r2, r, x, W1x, W1y, W2x, W2y])
         value += 2500
-    return result
+    return prepare_zkp_rounds(perdesen,
+                              [(account.address, x, r) for account in users_accounts],
+                              auction_params["k"],
+                              auction.max_bid)
 
 
-def get_winner(results):
-    for res in results:
-        acc_addr, w1, w2, r1, r2, r, x, W1x, W1y, W2x, W2y = res
-        auction.zkp_commit(acc_addr, [W1x, W1y, W2x, W2y], auctioneer_account)
-        auction.zkp_verify(get_bs(  # TODO Something went wrong here
-            auction.number_zkp, w1, w2, r1, r2, r, x
-        ), auctioneer_account)
-    auction.verify_all(auctioneer_account)
+def get_winner(proofs):
+    batch = []
+    for proof in proofs:
+        response = []
+        for w1, w2, r1, r2, _, _ in proof.rounds:
+            response += get_bs(  # TODO Something went wrong here
+                auction.number_zkp, w1, w2, r1, r2, proof.r, proof.x
+            )
+        batch.append((proof.address, proof.commits, response))
+    # Transactions from one account are mined in nonce order, so all chunks and VerifyAll
+    # are sent back-to-back and their receipts awaited together.
+    pending = auction.zkp_verify_batch(batch, auctioneer_account, wait=False)
+    pending.append(auction.verify_all(auctioneer_account, wait=False))
+    wait_all(pending)
     print(f"Winner is {auction.winner}")
 
 
@@ -0,0 +1,140 @@
+"""Off-chain alt_bn128 arithmetic of ``backend.pedersen`` against a naive affine implementation.
+
+Needs no chain::
+
+    python -m pytest tests/test_pedersen.py
+"""
+import pytest
+
+from backend import pedersen
+from backend.pedersen import CURVE_ORDER, DEFAULT_PARAMETERS, FIELD_MODULUS, PedersenEngine, get_engine
+
+P = FIELD_MODULUS
+G = (DEFAULT_PARAMETERS["gX"], DEFAULT_PARAMETERS["gY"])
+H = (DEFAULT_PARAMETERS["hX"], DEFAULT_PARAMETERS["hY"])
+INFINITY = (0, 0)
+SCALARS = [0, 1, 2, 3, 255, 256, 2 ** 64 + 7, 12345678901234567890123456789,
+           CURVE_ORDER - 1, CURVE_ORDER, CURVE_ORDER + 5, 2 ** 256 - 1]
+
+
+def naive_add(p, q):
+    if p == INFINITY:
+        return q
+    if q == INFINITY:
+        return p
+    (x1, y1), (x2, y2) = p, q
+    if x1 == x2:
+        if (y1 + y2) % P == 0:
+            return INFINITY
+        slope = 3 * x1 * x1 * pow(2 * y1, -1, P)
+    else:
+        slope = (y2 - y1) * pow(x2 - x1, -1, P)
+    x3 = (slope * slope - x1 - x2) % P
+    return x3, (slope * (x1 - x3) - y1) % P
+
+
+def naive_mul(k, p):
+    """Double-and-add without reducing ``k``, so multiples of the order give the point at infinity."""
+    acc = INFINITY
+    for bit in bin(k)[2:]:
+        acc = naive_add(acc, acc)
+        if bit == "1":
+            acc = naive_add(acc, p)
+    return acc
+
+
+def naive_commit(b, r):
+    return naive_add(naive_mul(b, G), naive_mul(r, H))
+
+
+def negate(p):
+    return p if p == INFINITY else (p[0], (P - p[1]) % P)
+
+
+@pytest.fixture(scope="module")
+def engine():
+    return get_engine(**DEFAULT_PARAMETERS)
+
+
+@pytest.mark.parametrize("b", SCALARS)
+def test_commit_matches_naive(engine, b):
+    r = (b * 7 + 11) % 2 ** 256
+    assert engine.commit(b, r) == naive_commit(b, r)
+
+
+@pytest.mark.parametrize("window", [1, 4, 5, 8])
+def test_window_tables_match_naive(window):
+    small = PedersenEngine(**DEFAULT_PARAMETERS, window=window)
+    for b in SCALARS:
+        assert small.commit(b, 0) == naive_mul(b, G)
+        assert small.commit(0, b) == naive_mul(b, H)
+
+
+def test_scalars_reduced_modulo_order(engine):
+    assert engine.commit(CURVE_ORDER + 3, CURVE_ORDER + 4) == engine.commit(3, 4)
+    assert engine.commit(-3, -4) == engine.commit(CURVE_ORDER - 3, CURVE_ORDER - 4)
+    assert engine.ec_mul(CURVE_ORDER + 2, *G) == naive_mul(2, G)
+
+
+def test_point_at_infinity(engine):
+    assert engine.commit(0, 0) == INFINITY
+    assert engine.commit(CURVE_ORDER, CURVE_ORDER) == INFINITY
+    assert engine.ec_mul(0, *G) == INFINITY
+    assert engine.ec_mul(CURVE_ORDER, *G) == INFINITY
+    assert engine.ec_mul(5, *INFINITY) == INFINITY
+    assert engine.ec_add(*G, *INFINITY) == G
+    assert engine.ec_add(*INFINITY, *H) == H
+    assert engine.ec_add(*G, *negate(G)) == INFINITY
+
+
+def test_verify(engine):
+    commitment = engine.commit(42, 4242)
+    assert engine.verify(42, 4242, *commitment)
+    assert not engine.verify(43, 4242, *commitment)
+    assert not engine.verify(42, 4243, *commitment)
+
+
+def test_commit_delta(engine):
+    c1, c2 = engine.commit(100, 7), engine.commit(30, 5)
+    assert engine.commit_delta(*c1, *c2) == engine.commit(70, 2)
+    assert engine.commit_delta(*c1, *c2) == naive_add(c1, negate(c2))
+
+
+def test_ec_add_and_mul(engine):
+    g2 = naive_mul(2, G)
+    assert engine.ec_add(*G, *G) == g2
+    assert engine.ec_add(*G, *H) == naive_add(G, H)
+    for k in SCALARS:
+        assert engine.ec_mul(k, *H) == naive_mul(k, H)
+
+
+def test_rejects_points_not_on_curve(engine):
+    with pytest.raises(ValueError):
+        engine.ec_add(1, 1, *G)
+    with pytest.raises(ValueError):
+        engine.ec_mul(2, G[0], G[1] + 1)
+    with pytest.raises(ValueError):
+        PedersenEngine(DEFAULT_PARAMETERS["q"], 1, 1, *H)
+
+
+def test_commit_many_matches_commit(engine):
+    values = SCALARS + [-5, 0, 17]
+    blindings = [0] + SCALARS[1:] + [-6, 0, CURVE_ORDER]  # (0, 0) is infinity in the middle of the batch
+    assert engine.commit_many(values, blindings) == [engine.commit(b, r) for b, r in zip(values, blindings)]
+
+
+def test_commit_many_in_process_pool(engine, monkeypatch):
+    monkeypatch.setattr(pedersen, "PARALLEL_MIN_ITEMS", 0)
+    values = list(range(-20, 20))
+    blindings = [3 * v + 1 for v in values]
+    expected = [engine.commit(b, r) for b, r in zip(values, blindings)]
+    assert engine.commit_many(values, blindings, processes=2, chunk_size=8) == expected
+    # the second call reuses the pool of the first one
+    pool = pedersen.get_process_pool(2)
+    assert engine.commit_many(values, blindings, processes=2, chunk_size=8) == expected
+    assert pedersen.get_process_pool(2) is pool
+
+
+def test_commit_many_length_mismatch(engine):
+    with pytest.raises(ValueError):
+        engine.commit_many([1, 2], [3])